@@ -1,15 +1,273 @@
-from typing import Dict
+import asyncio
+import inspect
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional, Tuple
 
+from .khl._types import MessageTypes
 from .khl.log import logger
 
+log = logger
+
 __name__ = "Handler"
 
+TypeCommandHandler = Callable[..., Coroutine]
+
+# msgs of these types are parsed as commands
+_COMMAND_MSG_TYPES = frozenset({MessageTypes.TEXT.value, MessageTypes.KMD.value})
+_QUOTES = frozenset('"\'')
+_TRUE = frozenset({'true', 'yes', 'y', 'on', '1'})
+_FALSE = frozenset({'false', 'no', 'n', 'off', '0'})
+
+
+class CommandError(Exception):
+    """raised when the args of a command can not be converted"""
+
+
+def tokenize(content: str) -> List[str]:
+    """split ``content`` into tokens in one pass
+
+    tokens are separated by whitespaces, quotes keep whitespaces in a token, backslash escapes the next char"""
+    tokens = []
+    buf = []
+    quote = None
+    in_token = False
+    escaped = False
+    for ch in content:
+        if escaped:
+            buf.append(ch)
+            escaped = False
+        elif ch == '\\':
+            escaped = in_token = True
+        elif quote is not None:
+            if ch == quote:
+                quote = None
+            else:
+                buf.append(ch)
+        elif ch in _QUOTES:
+            quote = ch
+            in_token = True
+        elif ch.isspace():
+            if in_token:
+                tokens.append(''.join(buf))
+                buf.clear()
+                in_token = False
+        else:
+            buf.append(ch)
+            in_token = True
+    if in_token:
+        tokens.append(''.join(buf))
+    return tokens
+
+
+def _to_bool(arg: str) -> bool:
+    lowered = arg.lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    raise ValueError(f'not a bool: {arg}')
+
+
+class Command:
+    """
+    a command, and the signature of its handler compiled into arg converters
+
+    the handler is called as ``handler(msg, *converted_args)``,
+    the annotation of each param after ``msg`` is its converter: int, float, bool, str or any callable taking a str,
+    a command is itself a handler taking ``(msg, converted_args)``, so it can be run by ``HandlerExecutor``
+    """
+
+    def __init__(self, name: str, handler: TypeCommandHandler, aliases: Iterable[str], router: 'CommandRouter',
+                 node: '_Node'):
+        if not asyncio.iscoroutinefunction(handler):
+            raise TypeError('command handler must be a coroutine.')
+        self.name = name
+        self.handler = handler
+        self.aliases = tuple(aliases)
+        self._router = router
+        self._node = node
+
+        params = list(inspect.signature(handler).parameters.values())[1:]  # the first one is msg
+        self._params: List[Tuple[str, Callable[[str], Any], Any]] = []
+        self._rest: Optional[Callable[[str], Any]] = None
+        for p in params:
+            converter = self._converter_of(p.annotation)
+            if p.kind == p.VAR_POSITIONAL:
+                self._rest = converter
+            elif p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD):
+                self._params.append((p.name, converter, p.default))
+        self._required = sum(1 for _, _, default in self._params if default is inspect.Parameter.empty)
+
+    def __repr__(self):
+        return f'<Command {self.name}>'
+
+    async def __call__(self, call: Tuple[Any, List[Any]]):
+        """run the handler with ``call``, a ``(msg, converted_args)`` pair"""
+        msg, args = call
+        await self.handler(msg, *args)
+
+    @staticmethod
+    def _converter_of(annotation) -> Callable[[str], Any]:
+        if annotation is inspect.Parameter.empty or annotation is str:
+            return str
+        if annotation is bool:
+            return _to_bool
+        return annotation
+
+    def subcommand(self, name: str, *, aliases: Iterable[str] = ()):
+        """decorator, register a handler as a subcommand, e.g. ``/role add``"""
+        return self._router.command(name, aliases=aliases, parent=self)
+
+    def convert(self, args: List[str]) -> List[Any]:
+        """convert raw args by the signature of the handler, raise CommandError if not fit"""
+        if len(args) < self._required:
+            missing = [name for name, _, _ in self._params[len(args):self._required]]
+            raise CommandError(f'{self.name}: missing args: {", ".join(missing)}')
+        if len(args) > len(self._params) and self._rest is None:
+            raise CommandError(f'{self.name}: too many args, at most {len(self._params)}')
+        converted = []
+        for i, arg in enumerate(args):
+            name, converter = (self._params[i][0], self._params[i][1]) if i < len(self._params) else ('*', self._rest)
+            try:
+                converted.append(converter(arg))
+            except (ValueError, TypeError) as e:
+                raise CommandError(f'{self.name}: bad arg {name}={arg!r}: {e}') from e
+        return converted
+
+
+class _Node:
+    """a node of the command trie, each edge is a token"""
+    __slots__ = ('children', 'command')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.command: Optional[Command] = None
+
+
+class CommandRouter:
+    """
+    commands in a token trie
+
+    1. a command and its aliases are edges to the same node, so subcommands are reachable via any alias
+    2. lookup walks the trie token by token, the deepest command on the path wins, the tokens left are its args
+    3. the cost of lookup only depends on the length of the msg, not on the count of commands
+    """
+
+    def __init__(self, prefixes: Iterable[str] = ('/',), case_sensitive: bool = False):
+        """
+        :param prefixes: a msg is a command only if it starts with one of them
+        :param case_sensitive: whether command names are matched case-sensitively
+        """
+        self._root = _Node()
+        self.case_sensitive = case_sensitive
+        self.prefixes = prefixes
+
+    @property
+    def prefixes(self) -> Tuple[str, ...]:
+        return self._prefixes
+
+    @prefixes.setter
+    def prefixes(self, prefixes: Iterable[str]):
+        if isinstance(prefixes, str):
+            prefixes = (prefixes,)
+        # the longest first, so '//' is not taken as '/'
+        self._prefixes = tuple(sorted(set(prefixes), key=len, reverse=True))
+
+    def _key(self, token: str) -> str:
+        return token if self.case_sensitive else token.lower()
+
+    def command(self, name: str, *, aliases: Iterable[str] = (), parent: Command = None):
+        """decorator, register a handler as a command named ``name``"""
+
+        def dec(handler: TypeCommandHandler) -> Command:
+            base = self._root if parent is None else parent._node
+            keys = [self._key(n) for n in (name, *aliases)]
+            for k in keys:
+                if k in base.children:
+                    raise ValueError(f'command {k} already registered')
+            node = _Node()
+            node.command = Command(name, handler, aliases, self, node)
+            for k in keys:
+                base.children[k] = node
+            log.debug(f'command {name} registered, handler: {handler.__qualname__}')
+            return node.command
+
+        return dec
+
+    def strip_prefix(self, content: str) -> Optional[str]:
+        """content without the prefix, None if it does not start with one"""
+        for prefix in self._prefixes:
+            if content.startswith(prefix):
+                return content[len(prefix):]
+        return None
+
+    def resolve(self, tokens: List[str]) -> Tuple[Optional[Command], List[str]]:
+        """the deepest command matching the leading tokens, and the rest tokens as its args"""
+        node = self._root
+        found, found_at = None, 0
+        for i, token in enumerate(tokens):
+            node = node.children.get(self._key(token))
+            if node is None:
+                break
+            if node.command is not None:
+                found, found_at = node.command, i + 1
+        return found, tokens[found_at:]
+
+    def parse(self, content: str) -> Tuple[Optional[Command], List[str]]:
+        """prefix check, tokenize and resolve ``content``"""
+        body = self.strip_prefix(content)
+        if body is None:
+            return None, []
+        return self.resolve(tokenize(body))
+
+
 class msgHandler:
+    """
+    handle commands in msgs
+
+    commands are registered by ``@msgHandler.command(name)``, prefixes are set from ``command_prefix`` in config
+    """
     _pkg = Dict
-    command_handle_list = []
+    router = CommandRouter()
 
-    def __init__(self, pkg) -> None:
+    def __init__(self, pkg, make_msg: Callable[[Dict], Any] = None) -> None:
+        """
+        :param make_msg: builds the msg object passed to command handlers, the raw pkg is passed if not provided
+        """
         self._pkg = pkg
+        self._make_msg = make_msg
+
+    @classmethod
+    def configure(cls, command_prefix: Iterable[str]):
+        cls.router.prefixes = command_prefix
+
+    @classmethod
+    def command(cls, name: str, *, aliases: Iterable[str] = ()):
+        """decorator, register a command"""
+        return cls.router.command(name, aliases=aliases)
+
+    def resolve(self) -> Optional[Tuple[Command, Tuple[Any, List[Any]]]]:
+        """the command in the pkg and the arg to call it with, None if the pkg is not a valid command"""
+        pkg = self._pkg
+        if pkg.get('type') not in _COMMAND_MSG_TYPES:
+            return None
+        cmd, args = self.router.parse(pkg.get('content') or '')
+        if cmd is None:
+            return None
+        try:
+            converted = cmd.convert(args)
+        except CommandError as e:
+            log.info(f'command rejected: {e}')
+            return None
+        msg = self._make_msg(pkg) if self._make_msg else pkg
+        return cmd, (msg, converted)
 
     async def handle(self):
-        ...
+        """run the command in the pkg and wait for it, the client submits ``resolve()`` to its executor instead"""
+        found = self.resolve()
+        if found is None:
+            return
+        cmd, call = found
+        try:
+            await cmd(call)
+        except Exception as e:
+            log.exception(f'error raised during command {cmd.name}', exc_info=e)
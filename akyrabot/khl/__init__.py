@@ -17,9 +17,18 @@ from ._types import (
     FriendTypes
 )
 from .cert import Cert
-from .receiver import Receiver, WebsocketReceiver
+from .ingest import IngestQueue, OverflowPolicy
+from .receiver import Receiver, WebsocketReceiver, WebhookReceiver
+from .session import SessionManager
+from .ratelimit import RateLimiter
+from .cache import ResponseCache
+from .retry import RetryPolicy, CircuitBreaker, CircuitOpenError
 from .requester import HTTPRequester
+from .outbox import Outbox, SendPriority
 from .gateway import Gateway, Requestable
+from .asset import AssetCache, AssetUploader
+from .routing import HandlerIndex
+from .executor import HandlerExecutor
 from .client import Client
 
 # concepts
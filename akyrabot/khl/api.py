@@ -23,44 +23,50 @@ _Req = namedtuple('_Req', ['method', 'route', 'params'])
 def req(method: str, **http_fields):
     """meta-decorator
 
-    :returns a decorator to fill func with boilerplate"""
-
-    def _method(func: Callable):
-
-        @functools.wraps(func)
-        def req_maker(*args, **kwargs) -> _Req:
-            route = _RE_ROUTE.sub('-', func.__qualname__).lower().replace('.', '/')
-
-            # dump args into kwargs
-            param_names = list(inspect.signature(func).parameters.keys())
-            for i, arg in enumerate(args):
-                kwargs[param_names[i].lstrip('_')] = arg
-
-            params = _merge_params(method, http_fields, kwargs)
-            return _Req(method, route, params)
-
-        return req_maker
-
-    return _method
-
+    route, param names and http fields are resolved once when decorating,
+    so building a _Req is only filling the args in
 
-def _merge_params(method: str, http_fields: dict, req_args: dict) -> dict:
-    payload = req_args
+    :returns a decorator to fill func with boilerplate"""
     payload_key = 'params'  # default payload_key: params=
+    as_form = False
     if method == 'POST':
         payload_key = 'json'  # POST: in default json=
 
         content_type = http_fields.get('headers', {}).get('Content-Type', None)
         if content_type == 'multipart/form-data':
-            payload_key, payload = _build_form_payload(req_args)
+            as_form = True
             # headers of form-data req are delegated to aiohttp
             http_fields = _remove_content_type(http_fields)
         elif content_type is not None:
             raise ValueError(f'unrecognized Content-Type {content_type}')
+    # dict fields are copied per req, the requester fills headers in place
+    dict_fields = tuple(k for k, v in http_fields.items() if isinstance(v, dict))
 
-    params = {payload_key: payload}
-    params.update(http_fields)
-    return params
+    def _method(func: Callable):
+        route = _RE_ROUTE.sub('-', func.__qualname__).lower().replace('.', '/')
+        param_names = tuple(name.lstrip('_') for name in inspect.signature(func).parameters)
+
+        @functools.wraps(func)
+        def req_maker(*args, **kwargs) -> _Req:
+            # dump args into kwargs
+            if args:
+                if len(args) > len(param_names):
+                    raise TypeError(f'{func.__qualname__}() takes {len(param_names)} args but {len(args)} were given')
+                kwargs.update(zip(param_names, args))
+
+            if as_form:
+                form_key, form = _build_form_payload(kwargs)
+                params = {form_key: form}
+            else:
+                params = {payload_key: kwargs}
+            params.update(http_fields)
+            for k in dict_fields:
+                params[k] = params[k].copy()
+            return _Req(method, route, params)
+
+        return req_maker
+
+    return _method
 
 
 def _remove_content_type(http_fields: dict) -> dict:
@@ -0,0 +1,182 @@
+"""asset uploading: content-hash dedup, bounded concurrency, streaming"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, IO, Optional, Tuple, Union
+
+from . import api
+from .flight import SingleFlight
+from .gateway import Gateway
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.asset"
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _hash_path(path: Union[str, Path]) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _hash_io(file: IO) -> Tuple[str, IO]:
+    """hash ``file`` chunk by chunk, returns the digest and a readable IO of the same content from its start
+
+    seekable files are rewound, the others are copied into a spooled temp file, which goes to disk when large"""
+    h = hashlib.sha256()
+    if file.seekable():
+        start = file.tell()
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+        file.seek(start)
+        return h.hexdigest(), file
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        h.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return h.hexdigest(), spool
+
+
+class AssetCache:
+    """
+    content hash -> asset url, persisted as json lines
+
+    entries are only appended, the file is read once on first use,
+    ``load()`` and ``put()`` do the file io in the default executor, so the loop is not blocked by disk
+    """
+
+    def __init__(self, path: Union[str, Path] = None):
+        """
+        :param path: file to persist the cache, memory only if not provided
+        """
+        self.path = path
+        self._urls: Optional[Dict[str, str]] = None
+
+    def _read(self) -> Dict[str, str]:
+        urls = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        urls[entry['sha256']] = entry['url']
+                    except (ValueError, KeyError):
+                        log.warning(f'broken line in asset cache {self.path}: {line!r}')
+        return urls
+
+    def _append(self, digest: str, url: str):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'sha256': digest, 'url': url}) + '\n')
+
+    def _load(self) -> Dict[str, str]:
+        if self._urls is None:
+            self._urls = self._read()
+        return self._urls
+
+    async def load(self) -> Dict[str, str]:
+        """read the file if not yet, off the loop"""
+        if self._urls is None:
+            urls = await asyncio.get_event_loop().run_in_executor(None, self._read)
+            if self._urls is None:  # another load may have finished meanwhile
+                self._urls = urls
+        return self._urls
+
+    def __len__(self):
+        return len(self._load())
+
+    def get(self, digest: str) -> Optional[str]:
+        """url of ``digest``, the file is read on the loop if ``load()`` was not awaited before"""
+        return self._load().get(digest)
+
+    async def put(self, digest: str, url: str):
+        urls = await self.load()
+        if urls.get(digest) == url:
+            return
+        urls[digest] = url
+        if self.path:
+            await asyncio.get_event_loop().run_in_executor(None, self._append, digest, url)
+
+
+class AssetUploader:
+    """
+    upload files as khl assets
+
+    1. the content is hashed chunk by chunk off the loop, a file already uploaded returns its cached url at once
+    2. concurrent uploads of the same content share one upload
+    3. at most ``concurrency`` uploads are in flight, the file is streamed into the request body
+    """
+
+    def __init__(self, gate: Gateway, *, concurrency: int = 4, cache: AssetCache = None):
+        """
+        :param concurrency: max uploads in flight
+        :param cache: content hash -> url cache, a memory only one if not provided
+        """
+        self.gate = gate
+        self.cache = cache if cache is not None else AssetCache()
+        self._concurrency = concurrency
+        self._sem: Optional[asyncio.Semaphore] = None  # created in the running loop
+        self._inflight = SingleFlight()
+
+        self.uploaded = 0
+        self.deduped = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """counters of the uploader"""
+        return {'uploaded': self.uploaded, 'deduped': self.deduped, 'cached': len(self.cache)}
+
+    async def upload(self, file: Union[IO, str, Path]) -> str:
+        """upload ``file``, return the url of it
+
+        if ``file`` is a str or Path, it is opened only when its upload starts"""
+        loop = asyncio.get_event_loop()
+        await self.cache.load()
+        if isinstance(file, (str, Path)):
+            digest = await loop.run_in_executor(None, _hash_path, file)
+        else:
+            digest, spooled = await loop.run_in_executor(None, _hash_io, file)
+            if spooled is not file:
+                return await self._upload_once(digest, spooled, owned=True)
+        return await self._upload_once(digest, file)
+
+    async def _upload_once(self, digest: str, file: Union[IO, str, Path], owned: bool = False) -> str:
+        """
+        :param owned: ``file`` is a spool of ours, it is closed once not needed, by the upload task if one starts,
+                      the caller may be cancelled while the shielded upload still reads it
+        """
+        url = self.cache.get(digest)
+        joining = url is None and digest in self._inflight
+        if url is not None or joining:
+            if owned:
+                file.close()
+            self.deduped += 1
+            if url is not None:
+                return url
+        return await self._inflight.run(digest, lambda: self._upload(digest, file, owned))
+
+    async def _upload(self, digest: str, file: Union[IO, str, Path], owned: bool = False) -> str:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._concurrency)
+        try:
+            async with self._sem:
+                if isinstance(file, (str, Path)):
+                    with open(file, 'rb') as f:
+                        url = (await self.gate.exec_req(api.Asset.create(file=f)))['url']
+                else:
+                    url = (await self.gate.exec_req(api.Asset.create(file=file)))['url']
+        finally:
+            if owned:
+                file.close()
+        self.uploaded += 1
+        await self.cache.put(digest, url)
+        log.debug(f'asset uploaded: {digest} -> {url}')
+        return url
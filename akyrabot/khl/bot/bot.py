@@ -1,5 +1,6 @@
 """implementation of bot"""
 import asyncio
+import functools
 import warnings
 import json
 import os
@@ -7,13 +8,15 @@ from pathlib import Path
 from typing import Dict, Callable, List, Optional, Union, Coroutine, IO, Any
 
 from .. import AsyncRunnable  # interfaces
-from .. import Cert, HTTPRequester, WebsocketReceiver, Gateway, Client  # net related
+from .. import Cert, SessionManager, ResponseCache, HTTPRequester, WebsocketReceiver, WebhookReceiver, Gateway, Client  # net related
 from .. import MessageTypes, EventTypes, SlowModeTypes, SoftwareTypes  # types
 from .. import User, Channel, PublicChannel, Guild, Event, Message  # concepts
 from ..game import Game
+from ..routing import IdFilter
 from ..task import TaskManager
 
 from ..log import logger
+from ...handle import msgHandler
 
 log = logger
 
@@ -27,11 +30,28 @@ TypeShutdownHandler = Callable[['Bot'], Coroutine]
 default_config = {
     "token": "xxxxxx",
     "port": 5000,
+    "verify_token": "",
+    "encrypt_key": "",
     "compress": True,
     "command_prefix": ["/"],
+    "queue_size": 4096,
+    "queue_overflow": "spill",
+    "workers": 4,
+    "worker_queue_size": 256,
+    "response_cache_size": 0,
+    "asset_cache_path": "./asset_cache.jsonl",
+    "upload_concurrency": 4,
+    "send_concurrency": 4,
+    "max_handler_tasks": 1024,
+    "handler_concurrency": 32,
+    "handler_timeout": 60,
     "super_user": ["1234567"]
 }
 
+# config keys passed to ``Client()`` as is
+_CLIENT_CONFIG_KEYS = ("queue_size", "queue_overflow", "workers", "worker_queue_size", "asset_cache_path",
+                       "upload_concurrency", "max_handler_tasks", "handler_concurrency", "handler_timeout")
+
 
 class Config:
     @staticmethod
@@ -113,7 +133,8 @@ class Bot(AsyncRunnable):
         self._startup_index = []
         self._shutdown_index = []
 
-    def _init_client(self, cert: Cert, client: Client, gate: Gateway, out: HTTPRequester, compress: bool, port, route):
+    def _init_client(self, cert: Cert, client: Client, gate: Gateway, out: HTTPRequester, compress: bool, port, route,
+                     cache_size: int = 0, send_concurrency: int = 4, **client_opts):
         """
         construct self.client from args.
 
@@ -127,37 +148,46 @@ class Bot(AsyncRunnable):
         :param compress: used to tune the receiver
         :param port: used to tune the WebhookReceiver
         :param route: used to tune the WebhookReceiver
+        :param cache_size: max entries of the requester's response cache, 0 disables it
+        :param send_concurrency: max outbound messages in flight, used to build the gate
+        :param client_opts: used to tune the client, passed to ``Client()`` as is
         :return:
         """
         if client:
             self.client = client
             return
         if gate:
-            self.client = Client(gate)
+            self.client = Client(gate, **client_opts)
             return
 
-        # client and gate not in args, build them
-        _out = out if out else HTTPRequester(cert)
+        # client and gate not in args, build them, requester and receiver share one connection pool
+        _session = SessionManager()
+        _cache = ResponseCache(max_entries=cache_size) if cache_size > 0 else None
+        _out = out if out else HTTPRequester(cert, session=_session, cache=_cache)
         if cert.type == Cert.Types.WEBSOCKET:
-            _in = WebsocketReceiver(cert, compress)
+            _in = WebsocketReceiver(cert, compress, session=_session)
+        elif cert.type == Cert.Types.WEBHOOK:
+            _in = WebhookReceiver(cert, port=port, route=route, compress=compress)
         else:
             raise ValueError(f'cert type: {cert.type} not supported')
 
-        self.client = Client(Gateway(_out, _in))
+        self.client = Client(Gateway(_out, _in, send_concurrency=send_concurrency), **client_opts)
 
     def add_event_handler(self, type: EventTypes, handler: TypeEventHandler):
         """add an event handler function for EventTypes `type`"""
         if type not in self._event_index:
             self._event_index[type] = []
         self._event_index[type].append(handler)
+        if getattr(self, 'client', None) is not None:
+            self.client.register_event(type, functools.partial(handler, self))
         log.debug(f'event_handler {handler.__qualname__} for {type} added')
         return handler
 
-    def add_message_handler(self, handler: TypeMessageHandler, *except_type: MessageTypes):
-        """`except_type` is an exclusion list"""
+    def add_message_handler(self, handler: TypeMessageHandler, *except_type: MessageTypes, **filters: IdFilter):
+        """`except_type` is an exclusion list, `filters` are passed to ``Client.register()``"""
         for type in MessageTypes:
             if type not in except_type:
-                self.client.register(type, handler)
+                self.client.register(type, handler, **filters)
 
     def on_event(self, type: EventTypes):
         """decorator, register a function to handle events of the type"""
@@ -167,14 +197,25 @@ class Bot(AsyncRunnable):
 
         return dec
 
-    def on_message(self, *except_type: MessageTypes):
+    def on_message(self,
+                   *except_type: MessageTypes,
+                   guild_id: IdFilter = None,
+                   channel_id: IdFilter = None,
+                   author_id: IdFilter = None):
         """
         decorator, register a function to handle messages
         :param except_type: excepted types
+        :param guild_id: only handle messages in the guild(s)
+        :param channel_id: only handle messages in the channel(s)
+        :param author_id: only handle messages from the user(s)
         """
 
         def dec(func: TypeMessageHandler):
-            self.add_message_handler(func, *set(except_type + (MessageTypes.SYS,)))
+            self.add_message_handler(func,
+                                     *set(except_type + (MessageTypes.SYS,)),
+                                     guild_id=guild_id,
+                                     channel_id=channel_id,
+                                     author_id=author_id)
 
         return dec
 
@@ -479,13 +520,23 @@ class Bot(AsyncRunnable):
 
     async def start(self):
         config = await Config.read("./config.json")
-        self._init_client(self.cert or Cert(token=config["token"]), self.client_, self.gate, self.out, config["compress"], config["port"], self.route)
+        client_opts = {k: config[k] for k in _CLIENT_CONFIG_KEYS if k in config}
+        cert = self.cert or Cert(token=config["token"],
+                                 verify_token=config.get("verify_token", ""),
+                                 encrypt_key=config.get("encrypt_key", ""))
+        msgHandler.configure(config.get("command_prefix", default_config["command_prefix"]))
+        self._init_client(cert, self.client_, self.gate, self.out, config["compress"], config["port"], self.route,
+                          config.get("response_cache_size", 0), config.get("send_concurrency", 4), **client_opts)
+        for type, handlers in self._event_index.items():
+            for handler in handlers:
+                self.client.register_event(type, functools.partial(handler, self))
 
         for func in self._startup_index:
             await func(self)
         if self._is_running:
             raise RuntimeError('this bot is already running')
         self.task.schedule()
+        await self.client.gate.warmup()
         await self.client.start()
 
     def run(self):
@@ -497,4 +548,6 @@ class Bot(AsyncRunnable):
         except KeyboardInterrupt:
             for func in self._shutdown_index:
                 self.loop.run_until_complete(func(self))
+            if getattr(self, 'client', None) is not None:
+                self.loop.run_until_complete(self.client.shutdown())
             log.info('see you next time')
@@ -0,0 +1,148 @@
+"""response cache of read-only khl api routes"""
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Set, Tuple, Any
+
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.cache"
+
+MISS = object()
+"""returned by ``ResponseCache.get()`` when there is no fresh entry"""
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache for responses of read-only routes
+
+    1. only GET routes with a TTL in ``ttls`` are cached, each entry expires after the TTL of its route
+    2. when the cache is full, the least recently used entry is evicted
+    3. a mutation route invalidates every cached entry of its resource, e.g. ``channel/update`` drops ``channel/*``,
+       plus the routes listed in ``INVALIDATES`` for that resource, e.g. ``guild/view`` which embeds channels
+    4. ``user/me`` is not cached, nothing invalidates it when the bot itself is updated
+    """
+    DEFAULT_TTLS: Dict[str, float] = {
+        'guild/list': 60,
+        'guild/view': 60,
+        'guild/user-list': 30,
+        'channel/list': 60,
+        'channel/view': 60,
+        'channel-role/index': 60,
+        'user/view': 60,
+        'guild-role/list': 60,
+        'guild-emoji/list': 300,
+    }
+    # resource of a mutation route -> routes of other resources that embed it
+    INVALIDATES: Dict[str, Tuple[str, ...]] = {
+        'guild': ('user/view',),
+        'guild-role': ('guild/view', 'guild/user-list', 'user/view'),
+        'channel': ('guild/view',),
+        'channel-role': ('channel/view',),
+    }
+
+    def __init__(self, max_entries: int = 1024, ttls: Dict[str, float] = None):
+        """
+        :param max_entries: max count of cached responses
+        :param ttls: route -> seconds, merged into ``DEFAULT_TTLS``, 0 disables caching of that route
+        """
+        self.max_entries = max_entries
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self._entries: 'OrderedDict[Hashable, Tuple[float, str, Any]]' = OrderedDict()
+        self._route_keys: Dict[str, Set[Hashable]] = {}
+        # route -> count of invalidations of it, a response fetched across one is not stored
+        self._generations: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """counters of the cache"""
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def cacheable(self, route: str) -> bool:
+        """whether responses of ``route`` are cached"""
+        return self.ttls.get(route, 0) > 0
+
+    def generation(self, route: str) -> int:
+        """invalidation count of ``route``, read it before sending a request and pass it to ``put()``"""
+        return self._generations.get(route, 0)
+
+    def get(self, key: Hashable) -> Any:
+        """fresh response of ``key``, or ``MISS``"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISS
+        expires_at, route, rsp = entry
+        if expires_at <= time.monotonic():
+            self._remove(key, route)
+            self.misses += 1
+            return MISS
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return rsp
+
+    def put(self, key: Hashable, route: str, rsp: Any, generation: int = None):
+        """
+        store a response of ``route``
+
+        :param generation: ``generation(route)`` read before the request was sent,
+                           the response is dropped if ``route`` was invalidated since then
+        """
+        if not self.cacheable(route) or (generation is not None and generation != self.generation(route)):
+            return
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (time.monotonic() + self.ttls[route], route, rsp)
+        self._route_keys.setdefault(route, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, (_, old_route, _) = self._entries.popitem(last=False)
+            self._route_keys[old_route].discard(old_key)
+            self.evictions += 1
+
+    def invalidate(self, route: str):
+        """drop entries affected by the mutation route ``route``"""
+        resource = route.split('/', 1)[0]
+        prefix = resource + '/'
+        routes = [r for r in self.ttls if r.startswith(prefix) and self.cacheable(r)]
+        routes.extend(r for r in self.INVALIDATES.get(resource, ()) if self.cacheable(r))
+        if not routes:
+            return  # e.g. message/create, no cached route is affected
+        for r in routes:
+            self._generations[r] = self.generation(r) + 1
+        dropped = self._drop_routes(routes)
+        if dropped:
+            self.invalidations += 1
+            log.debug(f'cache: {route} invalidated {dropped} entries')
+
+    def clear(self):
+        """drop all entries"""
+        for r in self.ttls:
+            self._generations[r] = self.generation(r) + 1
+        self._entries.clear()
+        self._route_keys.clear()
+
+    def _drop_routes(self, routes: Iterable[str]) -> int:
+        dropped = 0
+        for route in routes:
+            for key in self._route_keys.pop(route, ()):
+                if self._entries.pop(key, None) is not None:
+                    dropped += 1
+        return dropped
+
+    def _remove(self, key: Hashable, route: str):
+        self._entries.pop(key, None)
+        keys = self._route_keys.get(route)
+        if keys is not None:
+            keys.discard(key)
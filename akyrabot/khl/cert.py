@@ -2,6 +2,7 @@
 import base64
 import json
 from enum import Enum
+from typing import Union, Iterable, List
 
 from Cryptodome.Cipher import AES
 from Cryptodome.Util import Padding
@@ -45,21 +46,48 @@ class Cert:
         self.verify_token = verify_token
         self.encrypt_key = encrypt_key
 
+    @property
+    def encrypt_key(self) -> str:
+        """encrypt key from bot config panel"""
+        return self._encrypt_key
+
+    @encrypt_key.setter
+    def encrypt_key(self, value: str):
+        # AES key material is derived once here instead of on every packet
+        self._encrypt_key = value
+        self._aes_ecb = AES.new(key=value.encode().ljust(32, b'\x00'), mode=AES.MODE_ECB) if value else None
+
+    def decrypt_bytes(self, data: Union[bytes, str]) -> bytes:
+        """ decrypt data
+
+        :param data: encrypted byte array
+        :return: decrypted bytes, can be passed to json parsing as is
+        """
+        if self._aes_ecb is None:
+            return b''
+        data = base64.b64decode(data)
+        iv, cipher_text = data[0:16], base64.b64decode(data[16:])
+        # CBC by hand: P[i] = D(C[i]) ^ C[i-1], C[-1] = iv
+        # the ECB cipher keeps the expanded key, so no cipher is built per packet
+        plain = self._aes_ecb.decrypt(cipher_text)
+        chain = iv + cipher_text[:-16]
+        data = (int.from_bytes(plain, 'big') ^ int.from_bytes(chain, 'big')).to_bytes(len(cipher_text), 'big')
+        return Padding.unpad(data, 16)
+
     def decrypt(self, data: bytes) -> str:
         """ decrypt data
 
         :param data: encrypted byte array
         :return: decrypted str
         """
-        if not self.encrypt_key:
-            return ''
-        data = base64.b64decode(data)
-        data = AES.new(key=self.encrypt_key.encode().ljust(32, b'\x00'), mode=AES.MODE_CBC,
-                       iv=data[0:16]).decrypt(base64.b64decode(data[16:]))
-        data = Padding.unpad(data, 16)
-        return data.decode('utf-8')
+        return self.decrypt_bytes(data).decode('utf-8')
 
-    def decode_raw(self, raw: bytes) -> dict:
+    def decode_raw(self, raw: Union[bytes, str]) -> dict:
         """decode raw package into plaintext data"""
-        raw = json.loads(str(raw, encoding='utf-8'))
-        return json.loads(self.decrypt(raw['encrypt'])) if ('encrypt' in raw.keys()) else raw
+        raw = json.loads(str(raw, encoding='utf-8') if isinstance(raw, bytes) else raw)
+        return json.loads(self.decrypt_bytes(raw['encrypt'])) if ('encrypt' in raw) else raw
+
+    def decode_raw_batch(self, raws: Iterable[Union[bytes, str]]) -> List[dict]:
+        """decode a batch of raw packages, saves per-call overhead when draining many payloads at once"""
+        decode = self.decode_raw
+        return [decode(raw) for raw in raws]
@@ -1,11 +1,12 @@
 """abstraction of khl concept channel: where messages flow in"""
 import json
 from abc import ABC, abstractmethod
-from typing import Union, List, Dict
+from typing import Union, List, Dict, AsyncIterator
 
 from . import api
 from ._types import MessageTypes, ChannelTypes, SlowModeTypes, MessageFlagModes
 from .gateway import Requestable, Gateway
+from .outbox import SendPriority
 from .interface import LazyLoadable
 from .permission import ChannelPermission, PermissionHolder
 from .role import Role
@@ -95,7 +96,28 @@ class PublicChannel(Channel, PermissionHolder, ABC):
                          page_size: int = 50,
                          filter_user_id: str = None) -> List[User]:
         """list the users who can see this channel"""
-        params = {'guild_id': self.guild_id, 'channel_id': self.id, 'page': page, 'page_size': page_size}
+        params = self._user_list_params(search, role, mobile_verified, active_time, joined_at, filter_user_id)
+        params.update(page=page, page_size=page_size)
+        users = await self.gate.exec_paged_req(api.Guild.userList(**params))
+        return [User(_gate_=self.gate, _lazy_loaded_=True, **i) for i in users]
+
+    async def iter_users(self,
+                         search: str = None,
+                         role: Union[Role, str, int] = None,
+                         mobile_verified: bool = None,
+                         active_time: int = None,
+                         joined_at: int = None,
+                         filter_user_id: str = None,
+                         **kwargs) -> AsyncIterator[User]:
+        """iterate the users who can see this channel, as pages arrive
+
+        paged req, support standard pagination args"""
+        params = self._user_list_params(search, role, mobile_verified, active_time, joined_at, filter_user_id)
+        async for i in self.gate.aiter_paged(api.Guild.userList(**params), **kwargs):
+            yield User(_gate_=self.gate, _lazy_loaded_=True, **i)
+
+    def _user_list_params(self, search, role, mobile_verified, active_time, joined_at, filter_user_id) -> Dict:
+        params = {'guild_id': self.guild_id, 'channel_id': self.id}
         if search is not None:
             params['search'] = search
         if role is not None:
@@ -108,8 +130,7 @@ class PublicChannel(Channel, PermissionHolder, ABC):
             params['joined_at'] = joined_at
         if filter_user_id is not None:
             params['filter_user_id'] = filter_user_id
-        users = await self.gate.exec_paged_req(api.Guild.userList(**params))
-        return [User(_gate_=self.gate, _lazy_loaded_=True, **i) for i in users]
+        return params
 
     async def list_messages(self,
                             page_size: int = None,
@@ -141,11 +162,19 @@ class PublicTextChannel(PublicChannel):
         super()._update_fields(**kwargs)
         self.slow_mode: int = kwargs.get('slow_mode')
 
-    async def send(self, content: Union[str, List], *, type: MessageTypes = None, temp_target_id: str = '', **kwargs):
+    async def send(self,
+                   content: Union[str, List],
+                   *,
+                   type: MessageTypes = None,
+                   temp_target_id: str = '',
+                   priority: SendPriority = SendPriority.NORMAL,
+                   **kwargs):
         """
         send a msg to the channel
 
         ``temp_target_id`` is available in PublicTextChannel, so ``send()`` is overloaded here
+
+        :param priority: msgs are queued per channel in the outbox, a higher priority is sent first
         """
         # if content is card msg, then convert it to plain str
         if isinstance(content, List):
@@ -160,7 +189,7 @@ class PublicTextChannel(PublicChannel):
         if temp_target_id:
             kwargs['temp_target_id'] = temp_target_id
 
-        return await self.gate.exec_req(api.Message.create(**kwargs))
+        return await self.gate.send_msg(api.Message.create(**kwargs), self.id, priority)
 
 
 class PublicVoiceChannel(PublicChannel):
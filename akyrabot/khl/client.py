@@ -3,18 +3,23 @@ import asyncio
 import inspect
 import time
 from pathlib import Path
-from typing import Dict, List, Callable, Coroutine, Union, IO, Optional
+from typing import Dict, List, Callable, Coroutine, Union, IO, Optional, AsyncIterator
 
 from . import api
+from .asset import AssetCache, AssetUploader
 from .channel import public_channel_factory, PublicChannel, Channel, PublicTextChannel, PublicVoiceChannel
 from .game import Game
 from .gateway import Gateway, Requestable
 from .guild import Guild, GuildBoost, ChannelCategory
+from .executor import HandlerExecutor
+from .ingest import IngestQueue, OverflowPolicy
+from .routing import HandlerIndex, IdFilter
 from .interface import AsyncRunnable
 from .message import RawMessage, Message, Event, PublicMessage, PrivateMessage
-from ._types import SoftwareTypes, MessageTypes, SlowModeTypes, GameTypes
+from ._types import SoftwareTypes, MessageTypes, SlowModeTypes, GameTypes, EventTypes
 from .user import User, Friend, FriendRequest
 from .util import unpack_id, unpack_value
+from ..handle import msgHandler
 
 from .log import logger
 
@@ -34,18 +39,63 @@ class Client(Requestable, AsyncRunnable):
 
     reminder: Client.loop only used to run handle_event() and registered handlers.
     """
-    _handler_map: Dict[MessageTypes, List[TypeHandler]]
-
-    def __init__(self, gate: Gateway):
+    _handlers: HandlerIndex
+
+    def __init__(self,
+                 gate: Gateway,
+                 *,
+                 queue_size: int = 4096,
+                 queue_overflow: Union[OverflowPolicy, str] = OverflowPolicy.SPILL,
+                 spill_path: str = None,
+                 workers: int = 4,
+                 worker_queue_size: int = 256,
+                 asset_cache_path: str = None,
+                 upload_concurrency: int = 4,
+                 max_handler_tasks: int = 1024,
+                 handler_concurrency: int = 32,
+                 handler_timeout: Optional[float] = 60):
+        """
+        :param queue_size: max pkg count buffered between receiver and handlers
+        :param queue_overflow: what to do when the buffer is full, refer to OverflowPolicy
+        :param spill_path: file used to spill pkgs with OverflowPolicy.SPILL
+        :param workers: count of pkg workers, pkgs in the same channel are always handled by the same worker,
+                        one after another, so this is also the max count of channels handled at once
+        :param worker_queue_size: max pkg count waiting for each worker
+        :param asset_cache_path: file to persist the content hash -> url cache of uploaded assets
+        :param upload_concurrency: max asset uploads in flight
+        :param max_handler_tasks: max handler calls running or queued, pkg workers wait when it is reached
+        :param handler_concurrency: max running calls of each handler
+        :param handler_timeout: seconds a handler call may run, None means no limit
+        """
+        if workers <= 0:
+            raise ValueError('workers should be positive')
         self.gate = gate
         self.ignore_self_msg = True
         self._me = None
-
-        self._handler_map = {}
-        self._pkg_queue = asyncio.Queue()
-
-    def register(self, type: MessageTypes, handler: TypeHandler):
-        """register handler to handle messages of type"""
+        self._me_id: Optional[str] = None  # resolved at start, self msgs are dropped by it before decoding
+        self._me_refresh: Optional[asyncio.Future] = None
+
+        self._handlers = HandlerIndex()
+        self._event_handlers: Dict[str, List[TypeHandler]] = {}  # raw extra.type -> handlers
+        self._pkg_queue = IngestQueue(queue_size, OverflowPolicy(queue_overflow), spill_path)
+        self._workers = workers
+        self._worker_queue_size = worker_queue_size
+        self.assets = AssetUploader(gate, concurrency=upload_concurrency, cache=AssetCache(asset_cache_path))
+        self.executor = HandlerExecutor(max_tasks=max_handler_tasks,
+                                        concurrency=handler_concurrency,
+                                        timeout=handler_timeout)
+
+    def register(self,
+                 type: MessageTypes,
+                 handler: TypeHandler,
+                 *,
+                 guild_id: IdFilter = None,
+                 channel_id: IdFilter = None,
+                 author_id: IdFilter = None):
+        """register handler to handle messages of type
+
+        ``guild_id``, ``channel_id`` and ``author_id`` take an id or ids, the handler only gets msgs matching all of them,
+        a msg is not even built if no handler matches it"""
         if not asyncio.iscoroutinefunction(handler):
             raise TypeError('handler must be a coroutine.')
 
@@ -53,34 +103,101 @@ class Client(Requestable, AsyncRunnable):
         if len(params) != 1 or not issubclass(params[0].annotation, RawMessage):
             raise TypeError('handler must have one and only one param, and the param inherits RawMessage')
 
-        if type not in self._handler_map:
-            self._handler_map[type] = []
-        self._handler_map[type].append(handler)
+        self._handlers.add(type, handler, guild_id=guild_id, channel_id=channel_id, author_id=author_id)
+
+    def register_event(self, type: EventTypes, handler: Callable[[Event], Coroutine]):
+        """register handler to handle system events of type, it is looked up by the raw ``extra['type']`` of pkgs"""
+        if not asyncio.iscoroutinefunction(handler):
+            raise TypeError('handler must be a coroutine.')
+        self._event_handlers.setdefault(EventTypes(type).value, []).append(handler)
+
+    @property
+    def queue_stats(self) -> Dict[str, int]:
+        """metrics of the pkg queue between receiver and handlers"""
+        return self._pkg_queue.stats
 
     async def handle_pkg(self):
-        """consume `pkg` from `event_queue`"""
+        """consume `pkg` from `event_queue`, route it to a worker by its channel
+
+        pkgs from the same channel keep their order: the handler calls of a pkg finish before the next pkg is taken,
+        while different channels are handled in parallel"""
+        queues = [asyncio.Queue(self._worker_queue_size) for _ in range(self._workers)]
+        workers = [asyncio.ensure_future(self._pkg_worker(q), loop=self.loop) for q in queues]
+        try:
+            while True:
+                pkg: Dict = await self._pkg_queue.get()
+                if self._is_self_msg(pkg):
+                    self._pkg_queue.task_done()
+                    continue
+                await queues[hash(self._order_key(pkg)) % len(queues)].put(pkg)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _pkg_worker(self, queue: asyncio.Queue):
         while True:
-            pkg: Dict = await self._pkg_queue.get()
-            log.debug(f'upcoming pkg: {pkg}')
+            pkg: Dict = await queue.get()
+            log.debug('upcoming pkg: {}', pkg)
 
             try:
                 await self._consume_pkg(pkg)
             except Exception as e:
                 log.exception(e)
 
+            queue.task_done()
             self._pkg_queue.task_done()
 
+    @staticmethod
+    def _order_key(pkg: Dict) -> str:
+        """the key pkgs should be ordered by: the channel in guilds, the author in private chats"""
+        if pkg.get('channel_type') == 'PERSON':
+            return pkg.get('author_id')
+        return pkg.get('target_id')
+
+    def _is_self_msg(self, pkg: Dict) -> bool:
+        """whether ``pkg`` is a msg sent by the client itself and should be ignored, judged on the raw pkg"""
+        return (self.ignore_self_msg and self._me_id is not None and pkg.get('type') != MessageTypes.SYS.value
+                and pkg.get('author_id') == self._me_id)
+
+    def _watch_self_update(self, pkg: Dict):
+        """refresh the cached ``me`` in background when the client's user is updated"""
+        extra = pkg.get('extra') or {}
+        if extra.get('type') != EventTypes.USER_UPDATED.value or self._me_id is None:
+            return
+        if (extra.get('body') or {}).get('user_id') != self._me_id:
+            return
+        if self._me_refresh is None or self._me_refresh.done():
+            self._me_refresh = asyncio.ensure_future(self.fetch_me(force_update=True))
+            self._me_refresh.add_done_callback(self._me_refreshed)
+
+    @staticmethod
+    def _me_refreshed(fut: asyncio.Future):
+        if not fut.cancelled() and fut.exception() is not None:
+            log.error(f'refreshing me failed: {fut.exception()!r}')
+
     async def _consume_pkg(self, pkg: Dict):
         """
         spawn `msg` according to `pkg`,
-        check if ignore msgs from self
-        pass `msg` to corresponding handlers defined in `_handler_map`
+        pass `msg` to corresponding handlers matched in `_handlers`
+
+        msgs from self are already dropped in ``handle_pkg()``,
+        returns when all handler calls of the pkg are over, so the next pkg of the channel is handled after them
         """
-        msg = self._make_msg(pkg)
-        if self.ignore_self_msg and msg.type != MessageTypes.SYS:
-            if msg.author.id == (await self.fetch_me()).id:
-                return
-        self._dispatch_msg(msg)
+        calls = []
+        handlers = self._handlers.match(pkg)
+        if pkg.get('type') == MessageTypes.SYS.value:
+            self._watch_self_update(pkg)
+            event_type = (pkg.get('extra') or {}).get('type')
+            if event_type in self._event_handlers:
+                handlers = handlers + self._event_handlers[event_type]
+        if handlers:
+            calls.extend(await self._dispatch_msg(self._make_msg(pkg), handlers))
+        command = msgHandler(pkg, self._make_msg).resolve()
+        if command is not None:
+            # commands run under the same limits as msg handlers, never inline in the pkg worker
+            calls.append(await self.executor.submit(*command))
+        if calls:
+            await asyncio.wait(calls)
 
     def _make_msg(self, pkg: Dict):
         if pkg.get('type') == MessageTypes.SYS.value:
@@ -100,38 +217,38 @@ class Client(Requestable, AsyncRunnable):
             log.error(f'can not make msg from pkg: {pkg}')
         return msg
 
-    def _dispatch_msg(self, msg):
-        if not msg:
-            return
-        handlers = self._handler_map.get(msg.type, ())
-        for handler in handlers:
-            asyncio.ensure_future(self._handle_safe(handler)(msg), loop=self.loop)
+    async def _dispatch_msg(self, msg, handlers: List[TypeHandler]) -> List[asyncio.Future]:
+        """hand ``msg`` to the executor, waits when too many handler calls are in flight
 
-    @staticmethod
-    def _handle_safe(handler: TypeHandler):
+        :return: futures resolved when each call is over"""
+        if not msg:
+            return []
+        return [await self.executor.submit(handler, msg) for handler in handlers]
 
-        async def safe_handler(msg):
-            try:
-                await handler(msg)
-            except Exception as e:
-                log.exception('error raised during message handling', exc_info=e)
+    @property
+    def handler_stats(self) -> Dict[str, int]:
+        """metrics of handler calls: queued, running, timed out..."""
+        return self.executor.stats
 
-        return safe_handler
+    async def shutdown(self, timeout: float = 10):
+        """wait for running handlers to finish within ``timeout`` seconds, then release network resources"""
+        await self.executor.shutdown(timeout)
+        self._pkg_queue.close()
+        await self.gate.close()
 
     async def create_asset(self, file: Union[IO, str, Path]) -> str:
         """upload ``file`` to khl, and return the url to the file
 
-        if ``file`` is a str or Path, ``open(file, 'rb')`` will be called to convert it into IO
+        if ``file`` is a str or Path, ``open(file, 'rb')`` will be called to convert it into IO,
+        a content uploaded before returns its url without uploading again, refer to ``AssetUploader``
         """
-        if not isinstance(file, (str, Path)):
-            return (await self.gate.exec_req(api.Asset.create(file=file)))['url']
-        with open(file, 'rb') as f:
-            return (await self.gate.exec_req(api.Asset.create(file=f)))['url']
+        return await self.assets.upload(file)
 
     async def fetch_me(self, force_update: bool = False) -> User:
         """fetch detail of the ``User`` on the client"""
         if force_update or not self._me or not self._me.is_loaded():
             self._me = User(_gate_=self.gate, _lazy_loaded_=True, **(await self.gate.exec_req(api.User.me())))
+            self._me_id = self._me.id
         return self._me
 
     @property
@@ -169,6 +286,13 @@ class Client(Requestable, AsyncRunnable):
         guilds_data = (await self.gate.exec_paged_req(api.Guild.list(), **kwargs))
         return [Guild(_gate_=self.gate, _lazy_loaded_=True, **i) for i in guilds_data]
 
+    async def iter_guild_list(self, **kwargs) -> AsyncIterator[Guild]:
+        """iterate guilds which the client joined, as pages arrive
+
+        paged req, support standard pagination args"""
+        async for i in self.gate.aiter_paged(api.Guild.list(), **kwargs):
+            yield Guild(_gate_=self.gate, _lazy_loaded_=True, **i)
+
     async def leave(self, guild: Union[Guild, str]):
         """leave from ``guild``"""
         guild = Guild(_gate_=self.gate, id=guild) if isinstance(guild, str) else guild
@@ -349,6 +473,23 @@ class Client(Requestable, AsyncRunnable):
             api.GuildBoost.history(guild_id=unpack_id(guild), start_time=start_time, end_time=end_time), **kwargs)
         return [GuildBoost(**item, _gate_=self.gate) for item in boost_list]
 
+    async def iter_guild_boost(self,
+                               guild: Union[str, Guild],
+                               start_time: int = 0,
+                               end_time: int = None,
+                               **kwargs) -> AsyncIterator[GuildBoost]:
+        """
+        iterate the boost in guild, as pages arrive.
+
+        :param guild: guild_id or Guild object.
+        :param start_time: start_time time stamp (Sec).
+        :param end_time: end_time time stamp (Sec). Default to now time.
+        """
+        end_time = int(time.time()) if end_time is None else end_time
+        req = api.GuildBoost.history(guild_id=unpack_id(guild), start_time=start_time, end_time=end_time)
+        async for item in self.gate.aiter_paged(req, **kwargs):
+            yield GuildBoost(**item, _gate_=self.gate)
+
     async def fetch_friends(self) -> List[Friend]:
         """list friends who have been added to friend list"""
         friends = (await self.gate.exec_req(api.friend(type='friend')))['friend']
@@ -365,4 +506,6 @@ class Client(Requestable, AsyncRunnable):
         return [Friend(_gate_=self.gate, user_id=i['friend_info']['id'], **i) for i in friends]
 
     async def start(self):
+        # resolve the identity once, so self msgs can be told on the hot path without awaiting anything
+        await self.fetch_me()
         await asyncio.gather(self.handle_pkg(), self.gate.run(self._pkg_queue))
@@ -0,0 +1,175 @@
+"""handler execution: bounded concurrency, deadlines and tracking of handler tasks"""
+import asyncio
+import functools
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, Optional, Set, Tuple
+
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.executor"
+
+TypeHandler = Callable[[Any], Coroutine]
+
+
+def _name_of(handler: TypeHandler) -> str:
+    """readable name of a handler for logs, handlers can be partials or other callables without __qualname__"""
+    while isinstance(handler, functools.partial):
+        handler = handler.func
+    return getattr(handler, '__qualname__', None) or repr(handler)
+
+
+class _HandlerState:
+    """running count, waiting args and limits of one handler"""
+
+    def __init__(self, concurrency: int, timeout: Optional[float]):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.running = 0
+        self.pending: Deque[Tuple[Any, asyncio.Future]] = deque()
+
+
+class HandlerExecutor:
+    """
+    run handlers as tracked tasks, within limits
+
+    1. at most ``max_tasks`` handler calls are running or queued, ``submit()`` waits for a free slot,
+       so a flood pushes back on the pkg workers instead of piling up tasks
+    2. each handler runs at most ``concurrency`` calls at once, the rest queue up per handler,
+       calls beyond ``max_pending`` queued ones are dropped, so one slow handler can not take all slots
+    3. each call is cancelled after ``timeout`` seconds
+    4. running tasks are tracked, ``shutdown()`` waits for them to finish
+    5. ``submit()`` returns a future resolved when the call is over, however it ended, so callers can keep order
+    """
+    WARN_INTERVAL = 10
+
+    def __init__(self,
+                 *,
+                 max_tasks: int = 1024,
+                 concurrency: int = 32,
+                 max_pending: int = 256,
+                 timeout: Optional[float] = 60):
+        """
+        :param max_tasks: max handler calls running or queued, across all handlers
+        :param concurrency: default max running calls of one handler
+        :param max_pending: max queued calls of one handler
+        :param timeout: default seconds a call may run, None means no limit
+        """
+        self.max_tasks = max_tasks
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots: Optional[asyncio.Semaphore] = None  # created in the running loop
+        self._states: Dict[TypeHandler, _HandlerState] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+        self._last_warned: Dict[str, float] = {}  # kind of warning -> when it was last logged
+
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.dropped = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """counters of the executor"""
+        return {
+            'queued': sum(len(s.pending) for s in self._states.values()),
+            'running': len(self._tasks),
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'dropped': self.dropped,
+        }
+
+    def configure(self, handler: TypeHandler, *, concurrency: int = None, timeout: Optional[float] = ...):
+        """override the limits of ``handler``, ``timeout=None`` means no limit"""
+        state = self._state_of(handler)
+        if concurrency is not None:
+            state.concurrency = concurrency
+        if timeout is not ...:
+            state.timeout = timeout
+
+    def _state_of(self, handler: TypeHandler) -> _HandlerState:
+        state = self._states.get(handler)
+        if state is None:
+            state = self._states[handler] = _HandlerState(self.concurrency, self.timeout)
+        return state
+
+    async def submit(self, handler: TypeHandler, arg: Any) -> asyncio.Future:
+        """schedule ``handler(arg)``, waits while ``max_tasks`` calls are running or queued
+
+        :return: a future resolved with None when the call is over: completed, failed, timed out or dropped"""
+        over = asyncio.get_event_loop().create_future()
+        if self._closed:
+            over.set_result(None)
+            return over
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_tasks)
+        await self._slots.acquire()
+        state = self._state_of(handler)
+        if state.running < state.concurrency:
+            self._start(handler, state, arg, over)
+        elif len(state.pending) < self.max_pending:
+            state.pending.append((arg, over))
+        else:
+            self._slots.release()
+            self.dropped += 1
+            over.set_result(None)
+            self._warn('dropped', f'handler {_name_of(handler)} is overloaded, call dropped: {self.stats}')
+        return over
+
+    def _start(self, handler: TypeHandler, state: _HandlerState, arg: Any, over: asyncio.Future):
+        state.running += 1
+        task = asyncio.ensure_future(self._run(handler, state, arg))
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._done(t, handler, state, over))
+
+    async def _run(self, handler: TypeHandler, state: _HandlerState, arg: Any):
+        try:
+            await asyncio.wait_for(handler(arg), state.timeout)
+            self.completed += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self._warn('timed_out', f'handler {_name_of(handler)} timed out after {state.timeout}s')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            log.exception('error raised during message handling', exc_info=e)
+
+    def _done(self, task: asyncio.Task, handler: TypeHandler, state: _HandlerState, over: asyncio.Future):
+        self._tasks.discard(task)
+        state.running -= 1
+        self._slots.release()
+        if not over.done():
+            over.set_result(None)
+        if state.pending and not self._closed:
+            self._start(handler, state, *state.pending.popleft())
+
+    def _warn(self, kind: str, message: str):
+        """log a warning, at most once per ``WARN_INTERVAL`` for each kind, so a flood does not flood the log"""
+        now = time.monotonic()
+        if now - self._last_warned.get(kind, -self.WARN_INTERVAL) >= self.WARN_INTERVAL:
+            self._last_warned[kind] = now
+            log.warning(message)
+
+    async def shutdown(self, timeout: float = 10):
+        """stop taking calls, drop queued ones, wait ``timeout`` seconds for running ones, then cancel the rest"""
+        self._closed = True
+        for state in self._states.values():
+            for _, over in state.pending:
+                self._slots.release()
+                if not over.done():
+                    over.set_result(None)
+            state.pending.clear()
+        if not self._tasks:
+            return
+        _, running = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in running:
+            task.cancel()
+        if running:
+            log.warning(f'{len(running)} handler tasks cancelled at shutdown')
+            await asyncio.gather(*running, return_exceptions=True)
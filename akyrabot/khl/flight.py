@@ -0,0 +1,39 @@
+"""single flight: concurrent calls of the same key share one task"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+__name__ = "Kook.flight"
+
+
+class SingleFlight:
+    """
+    run at most one task per key
+
+    1. the first call of a key starts the task, calls of the key while it runs join it and get the same result
+    2. callers wait through a shield, one caller cancelled does not cancel the task for the others
+    3. the key is forgotten once its task is done, the next call starts a new one
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """whether a task of ``key`` is running, a call now would join it"""
+        return key in self._tasks
+
+    async def run(self, key: Hashable, start: Callable[[], Awaitable]) -> Any:
+        """result of the running task of ``key``, ``start()`` is called to create one only if there is none"""
+        fut = self._tasks.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(start())
+            self._tasks[key] = fut
+            fut.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(fut)
+
+    def _done(self, key: Hashable, fut: asyncio.Future):
+        self._tasks.pop(key, None)
+        if not fut.cancelled():
+            fut.exception()  # mark retrieved, callers may all have gone
@@ -1,9 +1,10 @@
 """gateway related stuff"""
-import asyncio
 from abc import ABC
-from typing import Union, List
+from typing import Union, List, AsyncIterator
 
 from .api import _Req
+from .ingest import IngestQueue
+from .outbox import Outbox, SendPriority
 from .receiver import Receiver
 from .requester import HTTPRequester
 
@@ -16,24 +17,46 @@ class Gateway:
     """
     requester: HTTPRequester
     receiver: Receiver
+    outbox: Outbox
 
-    def __init__(self, requester: HTTPRequester, receiver: Receiver):
+    def __init__(self, requester: HTTPRequester, receiver: Receiver, *, send_concurrency: int = 4):
+        """
+        :param send_concurrency: max outbound messages in flight, refer to Outbox
+        """
         self.requester = requester
         self.receiver = receiver
+        self.outbox = Outbox(requester.exec_req, concurrency=send_concurrency)
 
     async def request(self, method: str, route: str, **params) -> Union[dict, list]:
         """execute raw request, this is just a wrapper for convenience"""
         return await self.requester.request(method, route, **params)
 
-    async def exec_req(self, r: _Req):
+    async def exec_req(self, r: _Req, *, deadline: float = None):
         """execute request, this is just a wrapper for convenience"""
-        return await self.requester.exec_req(r)
+        return await self.requester.exec_req(r, deadline=deadline)
+
+    async def send_msg(self, r: _Req, channel: str, priority: SendPriority = SendPriority.NORMAL):
+        """send a msg creating request through the outbox, wait for its response"""
+        return await self.outbox.send(r, channel, priority)
 
     async def exec_paged_req(self, r: _Req, **kwargs) -> List:
         """execute paged request, this is just a wrapper for convenience"""
         return await self.requester.exec_paged_req(r, **kwargs)
 
-    async def run(self, in_queue: asyncio.Queue):
+    def aiter_paged(self, r: _Req, **kwargs) -> AsyncIterator:
+        """iterate paged request lazily, this is just a wrapper for convenience"""
+        return self.requester.aiter_paged(r, **kwargs)
+
+    async def warmup(self):
+        """open pooled connections ahead of the first request"""
+        await self.requester.warmup()
+
+    async def close(self):
+        """release network resources, the shared session goes with the requester"""
+        await self.outbox.close()
+        await self.requester.close()
+
+    async def run(self, in_queue: IngestQueue):
         """run the receiver"""
         self.receiver.pkg_queue = in_queue
         await self.receiver.start()
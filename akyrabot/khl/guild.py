@@ -2,7 +2,7 @@
 import logging
 import time
 import warnings
-from typing import List, Union, Dict, IO
+from typing import List, Union, Dict, IO, AsyncIterator
 
 from . import api
 from ._types import ChannelTypes, GuildMuteTypes, BadgeTypes
@@ -257,6 +257,17 @@ class Guild(LazyLoadable, Requestable):
         users = await self.gate.exec_paged_req(api.Guild.userList(**params), **kwargs)
         return [User(_gate_=self.gate, _lazy_loaded_=True, **i) for i in users]
 
+    async def iter_user_list(self, channel: Union[Channel, str] = None, **kwargs) -> AsyncIterator[User]:
+        """iterate users in the guild/a channel belongs to the guild, as pages arrive
+
+        paged req, support standard pagination args"""
+        cid = channel.id if isinstance(channel, Channel) else channel
+        params = {'guild_id': self.id}
+        if cid is not None:
+            params['channel_id'] = cid
+        async for i in self.gate.aiter_paged(api.Guild.userList(**params), **kwargs):
+            yield User(_gate_=self.gate, _lazy_loaded_=True, **i)
+
     async def fetch_joined_channel(self,
                                    user: Union[User, str],
                                    page: int = 1,
@@ -390,6 +401,13 @@ class Guild(LazyLoadable, Requestable):
         emojis = await self.gate.exec_paged_req(api.GuildEmoji.list(guild_id=self.id))
         return [GuildEmoji(_gate_=self.gate, guild_id=self.id, **i) for i in emojis]
 
+    async def iter_emoji_list(self, **kwargs) -> AsyncIterator[GuildEmoji]:
+        """iterate guild emojis, as pages arrive
+
+        paged req, support standard pagination args"""
+        async for i in self.gate.aiter_paged(api.GuildEmoji.list(guild_id=self.id), **kwargs):
+            yield GuildEmoji(_gate_=self.gate, guild_id=self.id, **i)
+
     async def create_emoji(self, emoji: Union[IO, str], *, name: str = None) -> GuildEmoji:
         """upload a custom emoji to the guild
 
@@ -425,6 +443,18 @@ class Guild(LazyLoadable, Requestable):
             api.GuildBoost.history(guild_id=self.id, start_time=start_time, end_time=end_time), **kwargs)
         return [GuildBoost(**item, _gate_=self.gate) for item in boost_list]
 
+    async def iter_boost(self, start_time: int = 0, end_time: int = None, **kwargs) -> AsyncIterator[GuildBoost]:
+        """
+        iterate the boost in guild, as pages arrive.
+
+        :param start_time: start_time time stamp (Sec).
+        :param end_time: end_time time stamp (Sec). Default to now time.
+        """
+        end_time = int(time.time()) if end_time is None else end_time
+        req = api.GuildBoost.history(guild_id=self.id, start_time=start_time, end_time=end_time)
+        async for item in self.gate.aiter_paged(req, **kwargs):
+            yield GuildBoost(**item, _gate_=self.gate)
+
     async def fetch_badge(self, style: Union[int, BadgeTypes] = BadgeTypes.NAME) -> bytes:
         """get the badge of the guild"""
         return await self.gate.exec_req(api.Badge.guild(guild_id=self.id, style=unpack_value(style)))
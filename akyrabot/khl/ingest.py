@@ -0,0 +1,159 @@
+"""bounded queue between receiver and client, decouples socket reads from pkg handling"""
+import asyncio
+import json
+import os
+import tempfile
+from enum import Enum
+from typing import Dict, IO, Optional
+
+from ._types import MessageTypes
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.ingest"
+
+
+class OverflowPolicy(Enum):
+    """
+    what to do when the queue is full
+    """
+    BLOCK = 'block'
+    """
+    wait for free space, backpressure goes back to the receiver
+
+    CAUTION: the websocket read loop waits too, pongs are not read meanwhile,
+    so a long stall makes the heartbeat close a healthy connection
+    """
+    DROP_OLDEST = 'drop_oldest'
+    """
+    drop the oldest non-system pkg to make room, system events are kept as long as possible
+    """
+    SPILL = 'spill'
+    """
+    write the overflowed pkgs to disk, and read them back in order when there is free space, the default
+    """
+
+
+class IngestQueue(asyncio.Queue):
+    """
+    bounded pkg queue with overflow policy and high-water-mark metrics
+
+    the receiver puts decoded pkg into it, the client consumes from it
+    """
+
+    def __init__(self, maxsize: int = 4096, policy: OverflowPolicy = OverflowPolicy.SPILL, spill_path: str = None):
+        """
+        :param maxsize: max pkg count held in memory, must be positive
+        :param policy: overflow policy when the queue is full
+        :param spill_path: file used by OverflowPolicy.SPILL, an anonymous temp file as default
+        """
+        if maxsize <= 0:
+            raise ValueError('IngestQueue must be bounded, maxsize should be positive')
+        super().__init__(maxsize)
+        self.policy = policy
+        self._spill_path = spill_path
+        self._spill_file: Optional[IO] = None
+        self._spill_read_pos = 0
+        self._spilled_pending = 0
+
+        self.high_water_mark = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._warned = False
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """current metrics of the queue"""
+        return {
+            'size': self.qsize(),
+            'maxsize': self.maxsize,
+            'high_water_mark': self.high_water_mark,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'spill_pending': self._spilled_pending,
+        }
+
+    async def put(self, item: Dict):
+        if self.policy == OverflowPolicy.BLOCK:
+            await super().put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item: Dict):
+        if self.policy == OverflowPolicy.SPILL and (self._spilled_pending or self.full()):
+            # keep the order: once spilled, newcomers go to disk until the spill is drained
+            self._spill(item)
+            return
+        if self.policy == OverflowPolicy.DROP_OLDEST and self.full():
+            self._drop_oldest()
+        super().put_nowait(item)
+        self._record_size()
+
+    def get_nowait(self) -> Dict:
+        item = super().get_nowait()
+        if self._spilled_pending:
+            self._refill()
+        return item
+
+    def _record_size(self):
+        size = self.qsize()
+        if size > self.high_water_mark:
+            self.high_water_mark = size
+        if not self._warned and size >= self.maxsize * 0.8:
+            self._warned = True
+            log.warning(f'ingest queue is nearly full: {self.stats}')
+        elif self._warned and size < self.maxsize * 0.5:
+            self._warned = False
+
+    def _drop_oldest(self):
+        queue = self._queue  # pylint: disable=no-member
+        victim = 0
+        for i, pkg in enumerate(queue):
+            if pkg.get('type') != MessageTypes.SYS.value:
+                victim = i
+                break
+        del queue[victim]
+        self.task_done()  # the dropped pkg will never be consumed
+        self.dropped += 1
+
+    def _spill(self, item: Dict):
+        if self._spill_file is None:
+            if self._spill_path:
+                self._spill_file = open(self._spill_path, 'w+b')
+            else:
+                self._spill_file = tempfile.TemporaryFile()
+            self._spill_read_pos = 0
+        self._spill_file.seek(0, 2)
+        self._spill_file.write(json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._spilled_pending += 1
+        self.spilled += 1
+
+    def _refill(self):
+        f = self._spill_file
+        f.seek(self._spill_read_pos)
+        while self._spilled_pending and not self.full():
+            super().put_nowait(json.loads(f.readline()))
+            self._spilled_pending -= 1
+        self._spill_read_pos = f.tell()
+        if not self._spilled_pending:
+            # drained, start over to keep the file small
+            f.seek(0)
+            f.truncate()
+            self._spill_read_pos = 0
+
+    def close(self):
+        """release the spill file, pkgs still spilled are dropped, a file at ``spill_path`` is removed"""
+        if self._spill_file is None:
+            return
+        if self._spilled_pending:
+            log.warning(f'ingest queue closed, {self._spilled_pending} spilled pkgs dropped')
+            self.dropped += self._spilled_pending
+        self._spill_file.close()
+        self._spill_file = None
+        self._spilled_pending = 0
+        if self._spill_path:
+            try:
+                os.remove(self._spill_path)
+            except FileNotFoundError:
+                pass
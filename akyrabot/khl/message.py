@@ -7,7 +7,9 @@ from . import api
 from .channel import PublicTextChannel, PrivateChannel
 from .context import Context
 from .gateway import Requestable
+from .outbox import SendPriority
 from .guild import Guild
+from .schema.wsHandler import EventHandler, EVENT_BODIES
 from ._types import MessageTypes, ChannelPrivacyTypes, EventTypes
 from .user import User, GuildUser
 
@@ -29,8 +31,12 @@ class RawMessage(ABC):
     msg_timestamp: int
     nonce: str
     extra: Any
+    _raw: Dict
+    _typed: Union[EventHandler.Main, None]
 
     def __init__(self, **kwargs):
+        self._raw = kwargs
+        self._typed = None
         self._msg_id = kwargs.get('msg_id')
         self._type = kwargs.get('type')
         self._channel_type = kwargs.get('channel_type')
@@ -56,6 +62,13 @@ class RawMessage(ABC):
         """type of the channel where the message in"""
         return ChannelPrivacyTypes(self._channel_type)
 
+    @property
+    def typed(self) -> EventHandler.Main:
+        """validated view of the raw package, built on first access"""
+        if self._typed is None:
+            self._typed = EventHandler.Main(**self._raw)
+        return self._typed
+
 
 class Message(RawMessage, Requestable, ABC):
     """
@@ -125,9 +138,12 @@ class Message(RawMessage, Requestable, ABC):
                     **kwargs):
         """
         reply to a msg, content can also be a card
+
+        replies are sent with SendPriority.INTERACTIVE unless ``priority`` is given
         """
         if use_quote:
             kwargs['quote'] = self.id
+        kwargs.setdefault('priority', SendPriority.INTERACTIVE)
 
         return await self.ctx.channel.send(content, type=type, **kwargs)
 
@@ -256,11 +272,22 @@ class PrivateMessage(Message):
 class Event(RawMessage):
     """sent by system, opposites to Message, carries various types of payload"""
 
+    _typed_body: Any = None
+
     @property
     def event_type(self) -> EventTypes:
         """type of the event, refer to EventTypes for enum detail"""
         return EventTypes(self.extra['type'])
 
+    @property
+    def typed_body(self) -> Any:
+        """validated view of the body, built on first access, None if the event_type has no model in EVENT_BODIES"""
+        if self._typed_body is None:
+            model = EVENT_BODIES.get(self.extra.get('type'))
+            if model is not None:
+                self._typed_body = model(**self.extra['body'])
+        return self._typed_body
+
     @property
     def body(self) -> Dict:
         """event body, a dict, refer to official docs with the event_type for the actual struct
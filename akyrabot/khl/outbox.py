@@ -0,0 +1,164 @@
+"""outbound message scheduling: per-channel queues, priorities, fair turns across channels"""
+import asyncio
+from collections import deque
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .api import _Req
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.outbox"
+
+
+class SendPriority(IntEnum):
+    """
+    priority class of an outbound message, the smaller goes first
+    """
+    INTERACTIVE = 0
+    """
+    replies to users, they are waiting for it
+    """
+    NORMAL = 1
+    """
+    the default
+    """
+    BULK = 2
+    """
+    broadcasts and other mass sends, only go when nothing else is waiting
+    """
+
+
+class Outbox:
+    """
+    schedule outbound messages before they are sent
+
+    1. each (channel, priority) pair has a FIFO queue, messages to one channel are sent one at a time, in order
+    2. a higher priority class is always served first, so replies do not wait behind broadcasts
+    3. within a priority class, channels take turns, one message each, so one busy channel can not starve the others
+    4. ``submit()`` returns a future of the response, the caller decides whether to wait for it
+    """
+
+    def __init__(self, send: Callable[[_Req], Awaitable[Any]], *, concurrency: int = 4):
+        """
+        :param send: coroutine that really sends a _Req, e.g. ``HTTPRequester.exec_req``
+        :param concurrency: max messages in flight, across all channels
+        """
+        self._send = send
+        self._concurrency = concurrency
+        self._queues: Dict[Tuple[SendPriority, str], Deque[Tuple[_Req, asyncio.Future]]] = {}
+        # channels with queued messages and nothing in flight, in turn order, one ring per priority
+        self._ready: List[Deque[str]] = [deque() for _ in SendPriority]
+        self._ready_set: List[Set[str]] = [set() for _ in SendPriority]
+        self._busy: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """counters of the outbox, ``queued_*`` are counts of waiting messages per priority"""
+        stats = {f'queued_{p.name.lower()}': 0 for p in SendPriority}
+        for (p, _), q in self._queues.items():
+            stats[f'queued_{p.name.lower()}'] += len(q)
+        stats.update({'in_flight': len(self._busy), 'sent': self.sent, 'failed': self.failed})
+        return stats
+
+    def submit(self, r: _Req, channel: str, priority: SendPriority = SendPriority.NORMAL) -> asyncio.Future:
+        """queue ``r`` to ``channel``, returns the future of its response"""
+        if not self._workers:
+            self._start()
+        fut = asyncio.get_event_loop().create_future()
+        priority = SendPriority(priority)
+        key = (priority, channel)
+        q = self._queues.get(key)
+        if q is None:
+            q = self._queues[key] = deque()
+        q.append((r, fut))
+        self._make_ready(priority, channel)
+        return fut
+
+    async def send(self, r: _Req, channel: str, priority: SendPriority = SendPriority.NORMAL):
+        """queue ``r`` to ``channel``, and wait for its response"""
+        return await self.submit(r, channel, priority)
+
+    def _start(self):
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self._concurrency)]
+
+    async def close(self):
+        """stop sending, messages still queued are cancelled"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for q in self._queues.values():
+            for _, fut in q:
+                fut.cancel()
+        self._queues.clear()
+        for ready, ready_set in zip(self._ready, self._ready_set):
+            ready.clear()
+            ready_set.clear()
+        self._busy.clear()
+
+    def _make_ready(self, priority: SendPriority, channel: str):
+        if channel in self._busy or channel in self._ready_set[priority]:
+            return
+        self._ready[priority].append(channel)
+        self._ready_set[priority].add(channel)
+        self._wakeup.set()
+
+    def _next(self) -> Optional[Tuple[str, _Req, asyncio.Future]]:
+        for priority, ready in zip(SendPriority, self._ready):
+            while ready:
+                channel = ready.popleft()
+                self._ready_set[priority].discard(channel)
+                if channel in self._busy:
+                    continue  # taken by a higher priority, put back when released
+                key = (priority, channel)
+                q = self._queues[key]
+                while q:
+                    r, fut = q.popleft()
+                    if not fut.cancelled():
+                        break
+                else:
+                    del self._queues[key]
+                    continue
+                if not q:
+                    del self._queues[key]
+                self._busy.add(channel)
+                return channel, r, fut
+        return None
+
+    def _release(self, channel: str):
+        self._busy.discard(channel)
+        for priority in SendPriority:
+            if (priority, channel) in self._queues:
+                self._make_ready(priority, channel)
+
+    async def _worker(self):
+        while True:
+            item = self._next()
+            if item is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            channel, r, fut = item
+            try:
+                rsp = await self._send(r)
+            except asyncio.CancelledError:
+                fut.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not fut.cancelled():
+                    fut.set_exception(e)
+            else:
+                self.sent += 1
+                if not fut.cancelled():
+                    fut.set_result(rsp)
+            finally:
+                self._release(channel)
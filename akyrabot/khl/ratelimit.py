@@ -0,0 +1,101 @@
+"""rate limit of khl api, learned from response headers"""
+import asyncio
+import time
+from typing import Dict, Mapping, Optional
+
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.ratelimit"
+
+
+class _Bucket:
+    """a rate limit bucket, shared by routes with the same X-Rate-Limit-Bucket"""
+
+    def __init__(self):
+        self.limit: Optional[int] = None  # unknown until the first response
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.window = 0.0
+        self.lock = asyncio.Lock()
+
+
+class RateLimiter:
+    """
+    hold requests before they hit 429
+
+    1. limits are learned from ``X-Rate-Limit-*`` headers of each response
+    2. requests of an exhausted bucket queue up in order, until the bucket resets
+    3. once the global limit is hit, all requests wait for it to reset
+    """
+    DEFAULT_RESET = 1.0
+
+    def __init__(self):
+        self._route_bucket: Dict[str, str] = {}
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global_reset_at = 0.0
+
+    def _bucket_of(self, route: str) -> _Bucket:
+        name = self._route_bucket.get(route, route)
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = _Bucket()
+        return bucket
+
+    async def acquire(self, route: str):
+        """wait until a request to ``route`` can be sent"""
+        bucket = self._bucket_of(route)
+        async with bucket.lock:
+            while True:
+                now = time.monotonic()
+                wait = self._global_reset_at - now
+                if bucket.remaining is not None and bucket.remaining <= 0 and bucket.reset_at > now:
+                    wait = max(wait, bucket.reset_at - now)
+                if wait <= 0:
+                    break
+                log.debug(f'rate limit: {route} waits {wait:.2f}s')
+                await asyncio.sleep(wait)
+            now = time.monotonic()
+            if bucket.reset_at <= now and bucket.limit is not None:
+                # a new window begins, assume it lasts as long as the last one, responses will correct it
+                bucket.remaining = bucket.limit
+                bucket.reset_at = now + bucket.window
+            if bucket.remaining is not None:
+                bucket.remaining -= 1
+
+    def update(self, route: str, headers: Mapping[str, str], status: int):
+        """learn the limit state from a response of ``route``"""
+        name = headers.get('X-Rate-Limit-Bucket')
+        if name and self._route_bucket.get(route) != name:
+            self._route_bucket[route] = name
+            if name not in self._buckets:
+                self._buckets[name] = _Bucket()
+        bucket = self._bucket_of(route)
+
+        try:
+            reset = float(headers.get('X-Rate-Limit-Reset', self.DEFAULT_RESET))
+        except ValueError:
+            reset = self.DEFAULT_RESET
+        limit = headers.get('X-Rate-Limit-Limit')
+        if limit is not None and limit.isdigit():
+            bucket.limit = int(limit)
+        remaining = headers.get('X-Rate-Limit-Remaining')
+        if remaining is not None and remaining.isdigit():
+            now = time.monotonic()
+            remaining = int(remaining)
+            if bucket.remaining is not None and bucket.reset_at > now:
+                # responses of concurrent requests come back in any order, the smaller one is fresher
+                remaining = min(remaining, bucket.remaining)
+            bucket.remaining = remaining
+            bucket.reset_at = now + reset
+            bucket.window = max(bucket.window, reset)
+
+        if status == 429:
+            bucket.remaining = 0
+            bucket.reset_at = time.monotonic() + reset
+            if 'X-Rate-Limit-Global' in headers:
+                self._global_reset_at = time.monotonic() + reset
+                log.warning(f'global rate limit hit, all requests wait {reset}s')
+            else:
+                log.warning(f'rate limit hit: {route}, wait {reset}s')
@@ -1,15 +1,20 @@
 import asyncio
+import random
 import time
 import zlib
 from abc import ABC, abstractmethod
-from typing import Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Deque, Optional, Set
 
 from aiohttp import ClientWebSocketResponse, ClientSession, web, WSMessage
 
 from .cert import Cert
+from .ingest import IngestQueue
 from .interface import AsyncRunnable
 from .schema.wsHandler import EventHandler
-from ..handle import msgHandler
+from .sequence import ReorderBuffer
+from .session import SessionManager
 
 from .log import logger
 
@@ -25,7 +30,10 @@ class Receiver(AsyncRunnable, ABC):
     1. receive raw data from Kook server
     2. decrypt & parse raw data into pkg
     3. put pkg into the pkg_queue() for others to use
+
+    handling is never done here, so a slow handler can not stall socket reads
     """
+    pkg_queue: IngestQueue
 
     @property
     def type(self) -> str:
@@ -37,95 +45,344 @@ class Receiver(AsyncRunnable, ABC):
         """run self"""
         raise NotImplementedError
 
+    @staticmethod
+    def _log_event(d: Dict):
+        """log an event, only envelope fields of the raw dict are read"""
+        channel_type = d.get('channel_type')  # 消息通道类型
+        if channel_type not in ('GROUP', 'PERSON'):
+            return
+        type = d.get('type')  # 消息类型
+        extra = d.get('extra') or {}
+        author = extra.get('author') or {}
+        user_name = author.get('username')  # 用户名
+        identify_num = author.get('identify_num')  # 用户名的认证数字
+        guild_id = extra.get('guild_id')  # 服务器ID
+        content = d.get('content')  # 消息内容
+        msg_id = d.get('msg_id')  # 消息ID
+        msg_timestamp = time.strftime("%m-%d %H:%M:%S", time.localtime((d.get('msg_timestamp') or 0) / 1000))  # 发送时间
+        if channel_type == "GROUP":
+            msg = f"{msg_timestamp} 服务器({guild_id})接收到消息: 通道类型: {channel_type}, 消息类型: {type}, 发送者: {user_name}#{identify_num}, 内容: \"{content}\" - {msg_id}"
+        else:
+            msg = f"{msg_timestamp} 接收到@{user_name}#{identify_num}私信消息: 通道类型: {channel_type}, 消息类型: {type}, 内容: \"{content}\" - {msg_id}"
+        log.info(msg)
+
 
 class WebsocketReceiver(Receiver):
     """receive data in websocket mode"""
+    HEARTBEAT_INTERVAL = 30
+    HEARTBEAT_JITTER = 5
+    PONG_TIMEOUT = 6
+    PONG_RETRY_DELAYS = (2, 4)
+    RECONNECT_BASE_DELAY = 1
+    RECONNECT_MAX_DELAY = 60
+    RETRY_BUDGET = 8
 
-    def __init__(self, cert: Cert, compress: bool):
+    def __init__(self, cert: Cert, compress: bool, validate: bool = False, session: SessionManager = None):
+        """
+        :param validate: validate every package against the schema on arrival,
+            by default only envelope fields are read and validation is deferred to ``RawMessage.typed``
+        :param session: shared session, a private one is created if not provided
+        """
         super().__init__()
         self._cert = cert
+        self._session = session or SessionManager()
         self.compress = compress
+        self.validate = validate
 
-        self._NEWEST_SN = 0
+        self._sequence = ReorderBuffer()
         self._RAW_GATEWAY = ''
+        self._SESSION_ID = ''
+        self._resume_attempts = 0
+
+        self._pong = asyncio.Event()
+        self._ping_sent_at = 0.0
+        self.heartbeat_rtt: Optional[float] = None
+        self.missed_pongs = 0
+
+        self._failures = 0
+        self.healthy = True
 
     @property
     def type(self) -> str:
         return 'websocket'
 
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """metrics of the connection"""
+        return {
+            'session_id': self._SESSION_ID,
+            **self._sequence.stats,
+            'heartbeat_rtt': self.heartbeat_rtt,
+            'missed_pongs': self.missed_pongs,
+            'healthy': self.healthy,
+            'failures': self._failures,
+        }
+
     async def heartbeat(self, ws_conn: ClientWebSocketResponse):
-        """Kook customized heartbeat scheme"""
-        while True:
+        """Kook customized heartbeat scheme
+
+        ping every 30±5s, a ping without pong in 6s is retried after 2s and 4s,
+        if still no pong, the connection is considered dead and closed, then a resume follows"""
+        while not ws_conn.closed:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL + random.uniform(-self.HEARTBEAT_JITTER, self.HEARTBEAT_JITTER))
             try:
-                await asyncio.sleep(26)
-                await ws_conn.send_json({'s': 2, 'sn': self._NEWEST_SN})
+                for delay in (0,) + self.PONG_RETRY_DELAYS:
+                    await asyncio.sleep(delay)
+                    if await self._ping(ws_conn):
+                        break
+                else:
+                    log.warning(f'no pong after {len(self.PONG_RETRY_DELAYS) + 1} pings, connection is dead')
+                    await ws_conn.close()
+                    return
             except ConnectionResetError:
                 return
             except Exception as e:
-                log.exception('error raised during websocket heartbeat',
-                              exc_info=e)
+                log.exception('error raised during websocket heartbeat', exc_info=e)
+                await ws_conn.close()
+                return
 
-    async def _get_gateway(self, cs: ClientSession):
+    async def _ping(self, ws_conn: ClientWebSocketResponse) -> bool:
+        """send a ping and wait for the pong, return whether the pong arrived in time"""
+        self._pong.clear()
+        self._ping_sent_at = time.monotonic()
+        await ws_conn.send_json({'s': 2, 'sn': self._sequence.newest})
+        try:
+            await asyncio.wait_for(self._pong.wait(), self.PONG_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            self.missed_pongs += 1
+            log.warning(f'heartbeat pong timeout, missed: {self.missed_pongs}')
+            return False
+
+    async def _get_gateway(self, cs: ClientSession) -> bool:
+        """fetch a new gateway url, return whether succeeded"""
         headers = {
             'Authorization': f'Bot {self._cert.token}',
             'Content-type': 'application/json'
         }
         params = {'compress': 1 if self.compress else 0}
-        async with cs.get(f"{API}/gateway/index",
-                          headers=headers,
-                          params=params) as res:
-            res_json = await res.json()
-            if res_json['code'] != 0:
-                log.error(f'getting gateway: {res_json}')
-                return
+        try:
+            async with cs.get(f"{API}/gateway/index",
+                              headers=headers,
+                              params=params) as res:
+                res_json = await res.json()
+        except Exception as e:
+            log.error(f'getting gateway: {e!r}')
+            return False
+        if res_json['code'] != 0:
+            log.error(f'getting gateway: {res_json}')
+            return False
+
+        self._RAW_GATEWAY = res_json['data']['url']
+        return True
+
+    async def _backoff(self):
+        """wait before the next connection attempt, exponential backoff with full jitter
 
-            self._RAW_GATEWAY = res_json['data']['url']
+        the first retry after a healthy connection waits at most RECONNECT_BASE_DELAY, so resume is fast"""
+        delay = random.uniform(0, min(self.RECONNECT_MAX_DELAY, self.RECONNECT_BASE_DELAY * 2 ** self._failures))
+        self._failures += 1
+        if self._failures >= self.RETRY_BUDGET and self.healthy:
+            self.healthy = False
+            log.error(f'websocket failed to connect {self._failures} times in a row, keep retrying in background')
+        log.info(f'reconnect in {delay:.1f}s')
+        await asyncio.sleep(delay)
+
+    def _mark_connected(self):
+        """a hello/resume ack arrived, the connection is good"""
+        self._failures = 0
+        self._resume_attempts = 0
+        if not self.healthy:
+            self.healthy = True
+            log.info('websocket recovered')
+
+    def _gateway_url(self) -> str:
+        """the url to connect, with resume params attached if there is a session to resume"""
+        if not self._SESSION_ID:
+            return self._RAW_GATEWAY
+        sep = '&' if '?' in self._RAW_GATEWAY else '?'
+        return f'{self._RAW_GATEWAY}{sep}resume=1&sn={self._sequence.newest}&session_id={self._SESSION_ID}'
+
+    def _reset_session(self):
+        """drop the current session, next connection will be a fresh one from a new gateway"""
+        self._SESSION_ID = ''
+        self._sequence.reset()
+        self._RAW_GATEWAY = ''
+        self._resume_attempts = 0
 
     async def _connect_gateway_and_handle_msg(self, cs: ClientSession):
-        async with cs.ws_connect(self._RAW_GATEWAY) as ws_conn:
-            asyncio.ensure_future(self.heartbeat(ws_conn), loop=self.loop)
+        resuming = bool(self._SESSION_ID)
+        try:
+            async with cs.ws_connect(self._gateway_url()) as ws_conn:
+                # the heartbeat lives and dies with this connection
+                heartbeat = asyncio.ensure_future(self.heartbeat(ws_conn), loop=self.loop)
+                releaser = asyncio.ensure_future(self._release_expired(), loop=self.loop)
 
-            log.info('[ init ] Kook模块启动')
-            try:
-                async for raw in ws_conn:
-                    raw: WSMessage
-                    await self._handle_raw(raw)
-            except Exception:
-                log.exception(
-                    'error raised during websocket receive, reconnect automatically'
-                )
+                log.info('[ init ] Kook模块启动' if not resuming else f'[ resume ] 正在恢复会话 sn={self._sequence.newest}')
+                try:
+                    async for raw in ws_conn:
+                        raw: WSMessage
+                        await self._handle_raw(raw, ws_conn)
+                except Exception:
+                    log.exception(
+                        'error raised during websocket receive, reconnect automatically'
+                    )
+                finally:
+                    heartbeat.cancel()
+                    releaser.cancel()
+        except Exception:
+            log.exception('error raised during websocket connect')
+
+        if not self._SESSION_ID:
+            # nothing to resume, the gateway may be the cause of the failure, fetch a new one next time
+            self._RAW_GATEWAY = ''
+            return
+        # the session is still there, try to resume it on the same gateway, give up after 2 attempts
+        self._resume_attempts += 1
+        if self._resume_attempts > 2:
+            log.warning('resume failed too many times, start a new session')
+            self._reset_session()
 
     async def start(self):
-        async with ClientSession(loop=self.loop) as cs:
-            while True:
-                await self._get_gateway(cs)
+        while True:
+            cs = self._session.session
+            # the gateway is only kept while resuming a session, a new session always fetches a new one
+            if (self._SESSION_ID and self._RAW_GATEWAY) or await self._get_gateway(cs):
                 await self._connect_gateway_and_handle_msg(cs)
+            await self._backoff()
 
-    async def _handle_raw(self, raw: WSMessage):
+    async def _handle_signal(self, pkg: Dict, ws_conn: ClientWebSocketResponse):
+        """handle non-event packages: HELLO(1), PONG(3), RECONNECT(5), RESUME ACK(6)"""
+        s = pkg.get('s')
+        d = pkg.get('d') or {}
+        if s == 1:
+            if d.get('code', 0) != 0:
+                log.error(f'hello failed: {d}, start a new session')
+                self._reset_session()
+                await ws_conn.close()
+                return
+            self._SESSION_ID = d.get('session_id', self._SESSION_ID)
+            self._mark_connected()
+            log.info(f'[ hello ] session_id: {self._SESSION_ID}')
+        elif s == 3:
+            self.heartbeat_rtt = time.monotonic() - self._ping_sent_at
+            self._pong.set()
+            log.debug(f'heartbeat rtt: {self.heartbeat_rtt * 1000:.1f}ms')
+        elif s == 5:
+            log.warning(f'server requires reconnect: {d}, start a new session')
+            self._reset_session()
+            await ws_conn.close()
+        elif s == 6:
+            self._SESSION_ID = d.get('session_id', self._SESSION_ID)
+            self._mark_connected()
+            log.info(f'[ resume ] session resumed, session_id: {self._SESSION_ID}')
+
+    async def _handle_raw(self, raw: WSMessage, ws_conn: ClientWebSocketResponse):
         try:
             data = raw.data
             data = zlib.decompress(data) if self.compress else data
             pkg: Dict = self._cert.decode_raw(data)
-            log.debug(f'upcoming raw: {pkg}')
-            pkg_handled = EventHandler(**pkg)
-            if pkg_handled.s != 0:
+            log.debug('upcoming raw: {}', pkg)
+            if self.validate:
+                EventHandler(**pkg)
+            if pkg.get('s') != 0:
+                await self._handle_signal(pkg, ws_conn)
                 return
-            self._NEWEST_SN = pkg_handled.sn
-            data_ = pkg_handled.d
-            type = int(data_.type)  # 消息类型
-            channel_type = data_.channel_type  # 消息通道类型
-            user_name = data_.extra.author.username  # 用户名
-            identify_num = data_.extra.author.identify_num  # 用户名的认证数字
-            guild_id = data_.extra.guild_id  # 服务器ID
-            content = data_.content  # 消息内容
-            msg_id = data_.msg_id  # 消息ID
-            msg_timestamp = time.strftime("%m-%d %H:%M:%S", time.localtime(data_.msg_timestamp / 1000))  # 发送时间
-            if channel_type == "GROUP":
-                msg = f"{msg_timestamp} 服务器({guild_id})接收到消息: 通道类型: {channel_type}, 消息类型: {type}, 发送者: {user_name}#{identify_num}, 内容: \"{content}\" - {msg_id}"
-            elif channel_type == "PERSON":
-                msg = f"{msg_timestamp} 接收到@{user_name}#{identify_num}私信消息: 通道类型: {channel_type}, 消息类型: {type}, 内容: \"{content}\" - {msg_id}"
-            log.info(msg)
-            # 这里后面接接口
-            await msgHandler(pkg['d']).handle()
+            # events can be redelivered or reordered around resume, release them in sn order
+            for pkg in self._sequence.push(pkg['sn'], pkg):
+                await self._enqueue(pkg)
         except Exception as e:
             log.exception(e)
+
+    async def _enqueue(self, pkg: Dict):
+        d = pkg['d']
+        self._log_event(d)
+        await self.pkg_queue.put(d)
+
+    async def _release_expired(self):
+        """events held for a gap should not wait for the next event to be released"""
+        while True:
+            await asyncio.sleep(self._sequence.hold)
+            for pkg in self._sequence.expire():
+                await self._enqueue(pkg)
+
+
+class WebhookReceiver(Receiver):
+    """receive data in webhook mode
+
+    stateless besides a short sn history, so several replicas can run behind a load balancer"""
+
+    def __init__(self, cert: Cert, *, port: int, route: str, compress: bool, decrypt_workers: int = 4):
+        """
+        :param port: the port to listen on
+        :param route: the path Kook posts to
+        :param decrypt_workers: threads used to decompress & decrypt payloads, keep the loop free
+        """
+        super().__init__()
+        self._cert = cert
+        self.port = port
+        self.route = route
+        self.compress = compress
+
+        self._executor = ThreadPoolExecutor(decrypt_workers, thread_name_prefix='kook-webhook')
+        self._sn_history: Deque[int] = deque(maxlen=1024)
+        self._sn_set: Set[int] = set()
+        self.app = web.Application()
+
+    @property
+    def type(self) -> str:
+        return 'webhook'
+
+    def _decode(self, data: bytes) -> Dict:
+        """runs in the executor"""
+        data = zlib.decompress(data) if self.compress else data
+        return self._cert.decode_raw(data)
+
+    def _is_dup(self, sn: int) -> bool:
+        """Kook retries the post if no response in time, drop the redelivered ones"""
+        if sn is None:
+            return False
+        if sn in self._sn_set:
+            return True
+        if len(self._sn_history) == self._sn_history.maxlen:
+            self._sn_set.discard(self._sn_history[0])
+        self._sn_history.append(sn)
+        self._sn_set.add(sn)
+        return False
+
+    async def _on_recv(self, request: web.Request) -> web.Response:
+        data = await request.read()
+        try:
+            pkg: Dict = await asyncio.get_running_loop().run_in_executor(self._executor, self._decode, data)
+        except Exception as e:
+            log.exception('error raised during webhook decoding', exc_info=e)
+            return web.Response(status=400)
+        log.debug('upcoming raw: {}', pkg)
+
+        d = pkg.get('d') or {}
+        if d.get('verify_token') != self._cert.verify_token:
+            log.warning(f'webhook verify_token mismatch, request from {request.remote} dropped')
+            return web.Response(status=403)
+        if pkg.get('s') != 0:
+            return web.Response()
+        if d.get('channel_type') == 'WEBHOOK_CHALLENGE':
+            return web.json_response({'challenge': d.get('challenge')})
+        if self._is_dup(pkg.get('sn')):
+            return web.Response()
+
+        self._log_event(d)
+        await self.pkg_queue.put(d)
+        return web.Response()
+
+    async def start(self):
+        self.app.router.add_post(self.route, self._on_recv)
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        site = web.TCPSite(runner, '0.0.0.0', self.port)
+        await site.start()
+        log.info(f'[ init ] Kook webhook模块启动, 监听 :{self.port}{self.route}')
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            self._executor.shutdown(wait=False)
@@ -1,10 +1,16 @@
 import asyncio
-from typing import Union, List
+import time
+from typing import Union, List, AsyncIterator, Dict, Optional, Tuple
 
-from aiohttp import ClientSession
+from aiohttp import FormData
 
 from .api import _Req
+from .cache import ResponseCache, MISS
 from .cert import Cert
+from .flight import SingleFlight
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .session import SessionManager
 
 from .log import logger
 
@@ -14,40 +20,168 @@ __name__ == "Khl.requester"
 API = 'https://www.kookapp.cn/api/v3'
 
 
+def _freeze(obj):
+    """nested dict/list -> nested tuple, so it can be hashed"""
+    if isinstance(obj, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def _req_key(method: str, route: str, params: Dict) -> Optional[Tuple]:
+    """identity of a request, None if params are not hashable"""
+    key = (method, route, _freeze(params))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 class HTTPRequester:
     """wrap raw requests, handle boilerplate param filling works"""
 
-    def __init__(self, cert: Cert):
+    MAX_RATE_LIMIT_RETRIES = 3
+    PAGE_PARALLELISM = 4
+
+    def __init__(self,
+                 cert: Cert,
+                 rate_limiter: RateLimiter = None,
+                 session: SessionManager = None,
+                 coalesce: bool = True,
+                 cache: ResponseCache = None,
+                 retry: RetryPolicy = None):
+        """
+        :param session: shared session, a private one is created if not provided
+        :param coalesce: concurrent identical GET requests share one request and its response
+        :param cache: cache of read-only routes, disabled if not provided
+        :param retry: retry policy and circuit breakers, a default one is created if not provided
+        """
         self._cert = cert
-        self._cs: Union[ClientSession, None] = None
+        self._session = session or SessionManager()
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self.coalesce = coalesce
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self._inflight = SingleFlight()
+
+    async def warmup(self):
+        """open pooled connections to khl server ahead of the first request"""
+        await self._session.warmup(API)
+
+    async def close(self):
+        """close the underlying session"""
+        await self._session.close()
+
+    async def request(self, method: str, route: str, *, deadline: float = None, **params) -> Union[dict, list, bytes]:
+        """wrap raw request, fill authorization, handle & extract response
+
+        transient failures are retried and failing routes fail fast, following ``retry``,
+        ``deadline`` overrides ``retry.deadline`` for this request,
+        concurrent identical GET requests are coalesced into one if ``coalesce`` is on,
+        GET responses of cacheable routes are served from ``cache`` while fresh, mutations invalidate them,
+        the callers may get the same response object, so it should be treated as read-only"""
+        if method != 'GET':
+            try:
+                return await self._send(method, route, deadline, params)
+            finally:
+                # even a failed mutation may have been applied
+                if self.cache is not None:
+                    self.cache.invalidate(route)
+
+        cached = self.cache is not None and self.cache.cacheable(route)
+        key = _req_key(method, route, params) if self.coalesce or cached else None
+        if key is None:
+            return await self._send(method, route, deadline, params)
+        if cached:
+            rsp = self.cache.get(key)
+            if rsp is not MISS:
+                return rsp
+        if not self.coalesce:
+            return await self._get(key, route, deadline, params)
 
-    def __del__(self):
-        if self._cs is not None:
-            asyncio.get_event_loop().run_until_complete(self._cs.close())
+        if key in self._inflight:
+            log.debug(f'{method} {route}: coalesced into the in-flight one')
+        return await self._inflight.run(key, lambda: self._get(key, route, deadline, params))
 
-    async def request(self, method: str, route: str, **params) -> Union[dict, list, bytes]:
-        """wrap raw request, fill authorization, handle & extract response"""
+    async def _get(self, key: Tuple, route: str, deadline: Optional[float], params: Dict) -> Union[dict, list, bytes]:
+        if self.cache is None:
+            return await self._send('GET', route, deadline, params)
+        generation = self.cache.generation(route)
+        rsp = await self._send('GET', route, deadline, params)
+        self.cache.put(key, route, rsp, generation)
+        return rsp
+
+    async def _send(self, method: str, route: str, deadline: Optional[float], params: Dict) -> Union[dict, list, bytes]:
+        """send the request until it succeeds, or the retry policy gives up"""
+        policy = self.retry
+        policy.prepare(method, route, params)
+        deadline = policy.deadline if deadline is None else deadline
+        expires_at = None if deadline is None else time.monotonic() + deadline
+        breaker = policy.breaker(route)
+        attempt = 0
+        while True:
+            attempt += 1
+            if breaker is not None:
+                breaker.before()
+            try:
+                timeout = None if expires_at is None else expires_at - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise asyncio.TimeoutError()
+                rsp = await asyncio.wait_for(self._request(method, route, **params), timeout)
+            except asyncio.CancelledError:
+                if breaker is not None:
+                    breaker.abort()
+                raise
+            except Exception as e:
+                transient = policy.is_transient(e)
+                if breaker is not None and transient:
+                    breaker.failure()
+                elif breaker is not None:
+                    breaker.success()  # a request rejected by khl still proves the route alive
+                if not policy.should_retry(method, route, params, e, attempt):
+                    raise
+                delay = policy.backoff(attempt)
+                if expires_at is not None and time.monotonic() + delay >= expires_at:
+                    raise
+                log.warning(f'{method} {route}: attempt {attempt} failed: {type(e).__name__} {e}, retry in {delay:.2f}s')
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.success()
+            return rsp
+
+    async def _request(self, method: str, route: str, **params) -> Union[dict, list, bytes]:
         headers = params.pop('headers', {})
         params['headers'] = headers
 
         log.debug(f'{method} {route}: req: {params}')  # token is excluded
         headers['Authorization'] = f'Bot {self._cert.token}'
-        if self._cs is None:  # lazy init
-            self._cs = ClientSession()
-        async with self._cs.request(method, f'{API}/{route}', **params) as res:
-            if res.content_type == 'application/json':
-                rsp = await res.json()
-                if rsp['code'] != 0:
-                    raise HTTPRequester.APIRequestFailed(method, route, params, rsp['code'], rsp['message'])
-                rsp = rsp['data']
-            else:
-                rsp = await res.read()
-            log.debug(f'{method} {route}: rsp: {rsp}')
-            return rsp
+        # form data can only be sent once
+        retries = 0 if isinstance(params.get('data'), FormData) else self.MAX_RATE_LIMIT_RETRIES
+        while True:
+            await self._rate_limiter.acquire(route)
+            async with self._session.session.request(method, f'{API}/{route}', **params) as res:
+                self._rate_limiter.update(route, res.headers, res.status)
+                if res.status == 429 and retries > 0:
+                    retries -= 1
+                    continue
+                if res.status >= 500:
+                    res.raise_for_status()
+                if res.content_type == 'application/json':
+                    rsp = await res.json()
+                    if rsp['code'] != 0:
+                        raise HTTPRequester.APIRequestFailed(method, route, params, rsp['code'], rsp['message'])
+                    rsp = rsp['data']
+                else:
+                    rsp = await res.read()
+                log.debug(f'{method} {route}: rsp: {rsp}')
+                return rsp
 
-    async def exec_req(self, r: _Req):
+    async def exec_req(self, r: _Req, *, deadline: float = None):
         """_Req -> raw request"""
-        return await self.request(r.method, r.route, **r.params)
+        return await self.request(r.method, r.route, deadline=deadline, **r.params)
 
     async def exec_paged_req(self,
                              r: _Req,
@@ -55,42 +189,96 @@ class HTTPRequester:
                              begin_page: int = 1,
                              end_page: int = None,
                              page_size: int = 50,
-                             sort: str = '') -> List:
+                             sort: str = '',
+                             parallelism: int = None) -> List:
         """
         execute paged requests
 
         iter from ``begin_page`` to the ``end_page``, ``end_page=None`` means to the end
 
-        1. get a req, inject the params
-        2. req and receive the result
-        3. unwrap the result, append result, fresh pagination params
+        1. req the first page, learn page_total from it
+        2. req the rest pages concurrently, at most ``parallelism`` in flight
+        3. unwrap the results, concat them in page order
 
         :param begin_page: int = 1,
         :param end_page: int = None,
         :param page_size: int = 50,
         :param sort: str = ''
+        :param parallelism: int = PAGE_PARALLELISM, max concurrent page requests
         """
-        ret = []
-        current_page = begin_page
-        while end_page is None or current_page <= end_page:
-            r.params['params']['page'] = current_page
-            r.params['params']['page_size'] = page_size
-            if sort:
-                r.params['params']['sort'] = sort
-
-            p = await self.exec_req(r)
+        if end_page is not None and end_page < begin_page:
+            return []
+        first = await self.exec_req(self._page_req(r, begin_page, page_size, sort))
+        ret = list(first['items'])
+        page_total = first['meta']['page_total']
+        page_size = first['meta']['page_size']
+        last_page = page_total if end_page is None else min(end_page, page_total)
 
-            ret.extend(p['items'])
-            current_page = p['meta']['page']
-            page_total = p['meta']['page_total']
-            page_size = p['meta']['page_size']
+        sem = asyncio.Semaphore(parallelism or self.PAGE_PARALLELISM)
 
-            current_page += 1
-            if end_page is None:
-                end_page = page_total
+        async def fetch(page: int) -> List:
+            async with sem:
+                return (await self.exec_req(self._page_req(r, page, page_size, sort)))['items']
 
+        tasks = [asyncio.ensure_future(fetch(page)) for page in range(first['meta']['page'] + 1, last_page + 1)]
+        try:
+            pages = await asyncio.gather(*tasks)
+        finally:
+            # one page failed or the caller is gone, the rest pages are useless
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks)
+        for items in pages:
+            ret.extend(items)
         return ret
 
+    async def aiter_paged(self,
+                          r: _Req,
+                          *,
+                          begin_page: int = 1,
+                          end_page: int = None,
+                          page_size: int = 50,
+                          sort: str = '',
+                          by_page: bool = False) -> AsyncIterator:
+        """
+        execute paged requests lazily, yield items as pages arrive
+
+        the next page is requested while the current one is being consumed, so at most two pages are held in memory
+
+        :param by_page: yield a list of items per page instead of single items
+        """
+        if end_page is not None and end_page < begin_page:
+            return
+        pending = asyncio.ensure_future(self.exec_req(self._page_req(r, begin_page, page_size, sort)))
+        try:
+            while pending is not None:
+                p = await pending
+                pending = None
+                meta = p['meta']
+                page_size = meta['page_size']
+                last_page = meta['page_total'] if end_page is None else min(end_page, meta['page_total'])
+                if meta['page'] < last_page:
+                    pending = asyncio.ensure_future(self.exec_req(self._page_req(r, meta['page'] + 1, page_size, sort)))
+                if by_page:
+                    yield p['items']
+                else:
+                    for item in p['items']:
+                        yield item
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    @staticmethod
+    def _page_req(r: _Req, page: int, page_size: int, sort: str) -> _Req:
+        """copy ``r`` with pagination params filled, so pages can be requested concurrently"""
+        params = dict(r.params['params'])
+        params['page'] = page
+        params['page_size'] = page_size
+        if sort:
+            params['sort'] = sort
+        return _Req(r.method, r.route, {**r.params, 'params': params})
+
     class APIRequestFailed(Exception):
         """Raised when khl.py received non-zero error code from remote server.
 
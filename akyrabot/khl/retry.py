@@ -0,0 +1,186 @@
+"""retry policy and circuit breakers of khl api requests"""
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, FrozenSet, Optional
+
+from aiohttp import ClientConnectorError, ClientError, ClientResponseError, FormData
+
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.retry"
+
+
+class CircuitOpenError(Exception):
+    """raised without sending the request, when the circuit of the route is open"""
+
+    def __init__(self, route: str, retry_after: float):
+        super().__init__()
+        self.route = route
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"circuit of '{self.route}' is open, retry after {self.retry_after:.1f}s"
+
+
+class CircuitBreaker:
+    """
+    fail fast on a route that keeps failing
+
+    1. closed: requests go through, consecutive transient failures are counted
+    2. open: after ``threshold`` failures, requests fail with CircuitOpenError for ``cooldown`` seconds
+    3. half-open: after the cooldown, one probe goes through, its result closes or reopens the circuit
+    """
+
+    def __init__(self, route: str, threshold: int, cooldown: float):
+        self.route = route
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def before(self):
+        """check the circuit before sending a request, raise CircuitOpenError if it should not be sent"""
+        state = self.state
+        if state == 'closed':
+            return
+        if state == 'half-open' and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(self.route, max(self.opened_at + self.cooldown - time.monotonic(), 0))
+
+    def success(self):
+        if self.opened_at is not None:
+            log.info(f'circuit of {self.route} closed')
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def abort(self):
+        """the request was cancelled, let another one probe"""
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+            log.warning(f'circuit of {self.route} opened after {self.failures} failures')
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class RetryPolicy:
+    """
+    decide which failed requests are sent again, and how long to wait between attempts
+
+    1. GET and the POST routes in ``IDEMPOTENT_POSTS`` are retried on transient failures:
+       network errors, timeouts and 5xx responses
+    2. routes in ``NONCE_ROUTES`` get a nonce if the caller did not give one, and are retried with the same nonce,
+       only when the request never reached khl: connection failures and 502/503/504 from the gateway
+    3. each attempt waits ``base_delay * 2^n`` seconds with full jitter, capped by ``max_delay``
+    4. all attempts of a request share one ``deadline``, asyncio.TimeoutError is raised when it passes
+    5. each route has a circuit breaker, ``breaker_threshold=0`` disables them
+    """
+    IDEMPOTENT_POSTS: FrozenSet[str] = frozenset({
+        'guild/nickname',
+        'guild-mute/create',
+        'guild-mute/delete',
+        'channel/update',
+        'channel/move-user',
+        'channel-role/update',
+        'message/update',
+        'message/add-reaction',
+        'message/delete-reaction',
+        'direct-message/update',
+        'direct-message/add-reaction',
+        'direct-message/delete-reaction',
+        'user/offline',
+        'guild-role/update',
+        'guild-role/grant',
+        'guild-role/revoke',
+        'intimacy/update',
+        'guild-emoji/update',
+        'game/activity',
+        'game/delete-activity',
+    })
+    NONCE_ROUTES: FrozenSet[str] = frozenset({'message/create', 'direct-message/create'})
+    UNDELIVERED_STATUSES: FrozenSet[int] = frozenset({502, 503, 504})
+
+    def __init__(self,
+                 *,
+                 max_retries: int = 3,
+                 base_delay: float = 0.5,
+                 max_delay: float = 8,
+                 deadline: float = None,
+                 breaker_threshold: int = 5,
+                 breaker_cooldown: float = 30):
+        """
+        :param max_retries: max extra attempts of a request, 0 disables retries
+        :param base_delay: seconds to wait before the first retry
+        :param max_delay: max seconds to wait between attempts
+        :param deadline: default seconds all attempts of a request may take, None means no limit
+        :param breaker_threshold: consecutive failures that open the circuit of a route
+        :param breaker_cooldown: seconds an open circuit fails fast
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def stats(self) -> Dict[str, str]:
+        """state of each circuit that is not closed"""
+        return {route: b.state for route, b in self._breakers.items() if b.state != 'closed'}
+
+    def breaker(self, route: str) -> Optional[CircuitBreaker]:
+        """circuit breaker of ``route``, None if disabled"""
+        if self.breaker_threshold <= 0:
+            return None
+        b = self._breakers.get(route)
+        if b is None:
+            b = self._breakers[route] = CircuitBreaker(route, self.breaker_threshold, self.breaker_cooldown)
+        return b
+
+    def prepare(self, method: str, route: str, params: Dict):
+        """fill a nonce into the body of nonce routes, so every attempt carries the same one"""
+        if method == 'POST' and route in self.NONCE_ROUTES:
+            body = params.get('json')
+            if isinstance(body, dict) and not body.get('nonce'):
+                params['json'] = {**body, 'nonce': uuid.uuid4().hex}
+
+    @staticmethod
+    def is_transient(exc: BaseException) -> bool:
+        """whether ``exc`` tells khl or the network is in trouble, rather than the request is wrong"""
+        if isinstance(exc, ClientResponseError):
+            return exc.status >= 500
+        return isinstance(exc, (ClientError, asyncio.TimeoutError))
+
+    def should_retry(self, method: str, route: str, params: Dict, exc: BaseException, attempt: int) -> bool:
+        """whether to send the request again after ``attempt`` failed attempts"""
+        if attempt > self.max_retries or not self.is_transient(exc) or isinstance(params.get('data'), FormData):
+            return False
+        if method == 'GET' or route in self.IDEMPOTENT_POSTS:
+            return True
+        if route in self.NONCE_ROUTES:
+            if isinstance(exc, ClientResponseError):
+                return exc.status in self.UNDELIVERED_STATUSES
+            return isinstance(exc, ClientConnectorError)
+        return False
+
+    def backoff(self, attempt: int) -> float:
+        """seconds to wait before attempt ``attempt + 1``"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
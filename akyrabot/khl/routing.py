@@ -0,0 +1,105 @@
+"""handler routing: pick the handlers of a pkg by lookup tables, instead of asking each handler"""
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from ._types import MessageTypes
+
+__name__ = "Kook.routing"
+
+IdFilter = Union[str, Iterable[str], None]
+
+# dimensions a handler can be filtered by, besides the msg type
+_DIMS = ('guild_id', 'channel_id', 'author_id')
+
+
+def route_key(pkg: Dict) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(guild_id, channel_id, author_id) of a raw pkg, None if the pkg does not have one"""
+    if pkg.get('channel_type') != 'GROUP':
+        return None, None, pkg.get('author_id')
+    if pkg.get('type') == MessageTypes.SYS.value:
+        # guild events are targeted at the guild
+        return pkg.get('target_id'), None, pkg.get('author_id')
+    return (pkg.get('extra') or {}).get('guild_id'), pkg.get('target_id'), pkg.get('author_id')
+
+
+def _as_set(ids: IdFilter) -> Optional[Set[str]]:
+    if ids is None:
+        return None
+    if isinstance(ids, str):
+        return {ids}
+    return set(ids)
+
+
+class _TypeTable:
+    """lookup tables of the handlers of one msg type"""
+
+    def __init__(self):
+        self.handlers: List[Callable] = []  # registration order, a handler's seq is its index
+        self.unfiltered: List[int] = []
+        self.filtered: Set[int] = set()
+        self.by_value: Tuple[Dict[str, Set[int]], ...] = tuple({} for _ in _DIMS)
+        self.wildcard: Tuple[Set[int], ...] = tuple(set() for _ in _DIMS)
+
+
+class HandlerIndex:
+    """
+    index of msg handlers, keyed by (type, guild_id, channel_id, author_id)
+
+    filters are compiled into per-dimension lookup tables when a handler is added,
+    matching a pkg costs a few dict lookups and set intersections, regardless of how many handlers there are
+    """
+
+    def __init__(self):
+        self._tables: Dict[MessageTypes, _TypeTable] = {}
+
+    def __len__(self):
+        return sum(len(t.handlers) for t in self._tables.values())
+
+    def add(self,
+            type: MessageTypes,
+            handler: Callable,
+            *,
+            guild_id: IdFilter = None,
+            channel_id: IdFilter = None,
+            author_id: IdFilter = None):
+        """add ``handler`` for msgs of ``type``, a filter left None matches any value"""
+        table = self._tables.get(type)
+        if table is None:
+            table = self._tables[type] = _TypeTable()
+        seq = len(table.handlers)
+        table.handlers.append(handler)
+
+        filters = [_as_set(guild_id), _as_set(channel_id), _as_set(author_id)]
+        if all(f is None for f in filters):
+            table.unfiltered.append(seq)
+            return
+        table.filtered.add(seq)
+        for dim, values in enumerate(filters):
+            if values is None:
+                table.wildcard[dim].add(seq)
+                continue
+            for value in values:
+                table.by_value[dim].setdefault(value, set()).add(seq)
+
+    def match(self, pkg: Dict) -> List[Callable]:
+        """handlers of a raw pkg, in registration order"""
+        try:
+            table = self._tables.get(MessageTypes(pkg.get('type')))
+        except ValueError:
+            return []
+        if table is None:
+            return []
+        if not table.filtered:
+            return list(table.handlers)
+
+        matched: Optional[Set[int]] = None
+        for dim, value in enumerate(route_key(pkg)):
+            candidates = table.wildcard[dim]
+            hits = table.by_value[dim].get(value) if value is not None else None
+            if hits:
+                candidates = candidates | hits
+            matched = candidates if matched is None else matched & candidates
+            if not matched:
+                break
+        if not matched:
+            return [table.handlers[seq] for seq in table.unfiltered]
+        return [table.handlers[seq] for seq in sorted(matched.union(table.unfiltered))]
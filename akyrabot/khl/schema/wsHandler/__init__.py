@@ -1,4 +1,4 @@
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 from .. import Base
 from ..objects import userBase
@@ -32,4 +32,85 @@ class EventHandler(Base):
     s: int
     d: Optional[Main]
     sn: Optional[int]
-    
\ No newline at end of file
+    
+
+class EventBody:
+    "系统事件 extra.body 的结构, 按 extra.type 取用"
+    class emoji(Base):
+        id: str
+        name: Optional[str]
+
+    class Reaction(Base):
+        msg_id: str
+        user_id: str
+        emoji: 'EventBody.emoji'
+        channel_id: Optional[str]
+        chat_code: Optional[str]
+
+    class BtnClick(Base):
+        value: str
+        msg_id: str
+        user_id: str
+        target_id: Optional[str]
+        user_info: Optional[dict]
+
+    class GuildMember(Base):
+        user_id: str
+        joined_at: Optional[int]
+        exited_at: Optional[int]
+        nickname: Optional[str]
+
+    class MemberStatus(Base):
+        user_id: str
+        event_time: Optional[int]
+        guilds: Optional[List[str]]
+
+    class ChannelMember(Base):
+        user_id: str
+        channel_id: str
+        joined_at: Optional[int]
+        exited_at: Optional[int]
+
+    class MessageChange(Base):
+        msg_id: str
+        channel_id: Optional[str]
+        chat_code: Optional[str]
+        content: Optional[str]
+        operator_id: Optional[str]
+        updated_at: Optional[int]
+
+    class UserUpdated(Base):
+        user_id: str
+        username: Optional[str]
+        avatar: Optional[str]
+
+    class SelfGuild(Base):
+        guild_id: str
+
+
+EventBody.Reaction.update_forward_refs(EventBody=EventBody)
+
+# extra.type -> model of extra.body
+EVENT_BODIES = {
+    'added_reaction': EventBody.Reaction,
+    'deleted_reaction': EventBody.Reaction,
+    'private_added_reaction': EventBody.Reaction,
+    'private_deleted_reaction': EventBody.Reaction,
+    'message_btn_click': EventBody.BtnClick,
+    'joined_guild': EventBody.GuildMember,
+    'exited_guild': EventBody.GuildMember,
+    'updated_guild_member': EventBody.GuildMember,
+    'guild_member_online': EventBody.MemberStatus,
+    'guild_member_offline': EventBody.MemberStatus,
+    'joined_channel': EventBody.ChannelMember,
+    'exited_channel': EventBody.ChannelMember,
+    'updated_message': EventBody.MessageChange,
+    'deleted_message': EventBody.MessageChange,
+    'updated_private_message': EventBody.MessageChange,
+    'deleted_private_message': EventBody.MessageChange,
+    'pinned_message': EventBody.MessageChange,
+    'unpinned_message': EventBody.MessageChange,
+    'user_updated': EventBody.UserUpdated,
+    'self_joined_guild': EventBody.SelfGuild,
+    'self_exited_guild': EventBody.SelfGuild,
+}
@@ -0,0 +1,103 @@
+"""sn ordering of gateway events: drop redelivered ones, release the rest in sequence"""
+import time
+from collections import deque
+from typing import Dict, List, Deque, Set
+
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.sequence"
+
+
+class ReorderBuffer:
+    """
+    a fixed-size window over gateway events
+
+    1. events with an sn already released or held, or a msg_id already released, are dropped as duplicates
+    2. events ahead of the next expected sn are held, until the gap is filled
+    3. a gap is given up when the window is full or the oldest held event waited longer than ``hold`` seconds
+    """
+
+    def __init__(self, window: int = 64, hold: float = 1.0, history: int = 1024):
+        """
+        :param window: max count of held events
+        :param hold: max seconds an event can be held for a gap
+        :param history: count of recent msg_ids remembered for deduplication
+        """
+        self.window = window
+        self.hold = hold
+        self.newest = 0
+        self._held: Dict[int, Dict] = {}
+        self._held_since = 0.0
+        self._msg_id_history: Deque[str] = deque(maxlen=history)
+        self._msg_ids: Set[str] = set()
+
+        self.dupes = 0
+        self.gaps = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """counters of the buffer"""
+        return {'newest_sn': self.newest, 'held': len(self._held), 'dupes': self.dupes, 'gaps': self.gaps}
+
+    def reset(self):
+        """forget the sn sequence, used when a new session starts, msg_ids are kept to catch redelivery"""
+        self.newest = 0
+        self._held.clear()
+
+    def push(self, sn: int, pkg: Dict) -> List[Dict]:
+        """feed an event, returns events ready to be released, in sn order"""
+        if sn <= self.newest or sn in self._held:
+            self.dupes += 1
+            log.debug(f'duplicated sn dropped: {sn}')
+            return []
+        if not self.newest or sn == self.newest + 1:
+            # the first event of a session starts the sequence
+            released = []
+            self._release(sn, pkg, released)
+            self._drain(released)
+            return released
+
+        if not self._held:
+            self._held_since = time.monotonic()
+        self._held[sn] = pkg
+        if len(self._held) > self.window:
+            return self._skip_gap()
+        return []
+
+    def expire(self) -> List[Dict]:
+        """give up the gap if held events waited too long, returns events ready to be released"""
+        if self._held and time.monotonic() - self._held_since >= self.hold:
+            return self._skip_gap()
+        return []
+
+    def _skip_gap(self) -> List[Dict]:
+        first = min(self._held)
+        self.gaps += 1
+        log.warning(f'sn gap given up: {self.newest + 1} ~ {first - 1}')
+        released = []
+        self._release(first, self._held.pop(first), released)
+        self._drain(released)
+        return released
+
+    def _drain(self, released: List[Dict]):
+        while self.newest + 1 in self._held:
+            sn = self.newest + 1
+            self._release(sn, self._held.pop(sn), released)
+        if self._held:
+            self._held_since = time.monotonic()
+
+    def _release(self, sn: int, pkg: Dict, released: List[Dict]):
+        self.newest = sn
+        msg_id = (pkg.get('d') or {}).get('msg_id')
+        if msg_id:
+            if msg_id in self._msg_ids:
+                self.dupes += 1
+                log.debug(f'duplicated msg_id dropped: {msg_id}')
+                return
+            if len(self._msg_id_history) == self._msg_id_history.maxlen:
+                self._msg_ids.discard(self._msg_id_history[0])
+            self._msg_id_history.append(msg_id)
+            self._msg_ids.add(msg_id)
+        released.append(pkg)
@@ -0,0 +1,68 @@
+"""managed aiohttp session, shared by the components talking to khl"""
+import asyncio
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from .log import logger
+
+log = logger
+
+__name__ = "Kook.session"
+
+
+class SessionManager:
+    """
+    one ``ClientSession`` over one tuned ``TCPConnector``
+
+    connections are kept alive and DNS results are cached, so requests skip the TCP/TLS handshake most of the time,
+    the session is created lazily inside the running loop and must be closed by ``await close()``
+    """
+
+    def __init__(self,
+                 *,
+                 limit: int = 100,
+                 limit_per_host: int = 30,
+                 keepalive_timeout: float = 60,
+                 ttl_dns_cache: int = 300,
+                 timeout: float = 30):
+        """
+        :param limit: max connections in the pool
+        :param limit_per_host: max connections to one host
+        :param keepalive_timeout: seconds an idle connection is kept
+        :param ttl_dns_cache: seconds a DNS result is cached
+        :param timeout: default total timeout of a request in seconds
+        """
+        self._connector_args = {
+            'limit': limit,
+            'limit_per_host': limit_per_host,
+            'keepalive_timeout': keepalive_timeout,
+            'ttl_dns_cache': ttl_dns_cache,
+        }
+        self._timeout = ClientTimeout(total=timeout)
+        self._cs: Optional[ClientSession] = None
+
+    @property
+    def session(self) -> ClientSession:
+        """the shared session, created on first use"""
+        if self._cs is None or self._cs.closed:
+            self._cs = ClientSession(connector=TCPConnector(**self._connector_args), timeout=self._timeout)
+        return self._cs
+
+    async def warmup(self, url: str, connections: int = 2):
+        """open ``connections`` connections to the host of ``url`` ahead of the first real request"""
+
+        async def touch():
+            async with self.session.head(url) as res:
+                await res.read()
+
+        results = await asyncio.gather(*(touch() for _ in range(connections)), return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            log.warning(f'warming up connections to {url} failed: {failed[0]!r}')
+
+    async def close(self):
+        """close the session and all pooled connections"""
+        if self._cs is not None and not self._cs.closed:
+            await self._cs.close()
+        self._cs = None
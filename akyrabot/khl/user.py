@@ -4,6 +4,7 @@ from typing import List, Union
 from . import api
 from ._types import MessageTypes, FriendTypes
 from .gateway import Requestable, Gateway
+from .outbox import SendPriority
 from .interface import LazyLoadable
 from .intimacy import Intimacy
 from .role import Role
@@ -50,11 +51,18 @@ class User(LazyLoadable, Requestable):
         self._update_fields(**(await self.gate.exec_req(api.User.view(self.id))))
         self._loaded = True
 
-    async def send(self, content: Union[str, List], *, type: MessageTypes = None, **kwargs):
+    async def send(self,
+                   content: Union[str, List],
+                   *,
+                   type: MessageTypes = None,
+                   priority: SendPriority = SendPriority.NORMAL,
+                   **kwargs):
         """
         send a msg to a channel
 
         ``temp_target_id`` is only available in ChannelPrivacyTypes.GROUP
+
+        :param priority: msgs are queued per user in the outbox, a higher priority is sent first
         """
         # if content is card msg, then convert it to plain str
         if isinstance(content, List):
@@ -68,7 +76,7 @@ class User(LazyLoadable, Requestable):
         kwargs['content'] = content
         kwargs['type'] = type.value
 
-        return await self.gate.exec_req(api.DirectMessage.create(**kwargs))
+        return await self.gate.send_msg(api.DirectMessage.create(**kwargs), f'user:{self.id}', priority)
 
     async def fetch_intimacy(self) -> Intimacy:
         """get the user's intimacy info"""
@@ -0,0 +1,80 @@
+"""decode_raw throughput on encrypted payloads, before and after caching the AES key material
+
+usage: python benchmarks/bench_cert_decrypt.py
+"""
+import base64
+import json
+import sys
+import timeit
+from pathlib import Path
+
+from Cryptodome.Cipher import AES
+from Cryptodome.Util import Padding
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from akyrabot.khl.cert import Cert  # noqa: E402
+
+ENCRYPT_KEY = 'bench-encrypt-key'
+
+
+def encrypt(pkg: dict) -> bytes:
+    """encrypt a pkg the way Kook does for webhook posts"""
+    iv = b'0123456789abcdef'
+    cipher = AES.new(ENCRYPT_KEY.encode().ljust(32, b'\x00'), AES.MODE_CBC, iv=iv)
+    data = cipher.encrypt(Padding.pad(json.dumps(pkg).encode(), 16))
+    return json.dumps({'encrypt': base64.b64encode(iv + base64.b64encode(data)).decode()}).encode()
+
+
+def corpus(n: int = 2000):
+    payloads = []
+    for sn in range(1, n + 1):
+        payloads.append(encrypt({
+            's': 0,
+            'sn': sn,
+            'd': {
+                'type': 1,
+                'channel_type': 'GROUP',
+                'target_id': '1234567890123456',
+                'author_id': '987654321',
+                'content': f'message {sn} ' * 8,
+                'msg_id': f'9d3c7a2e-{sn:08d}',
+                'msg_timestamp': 1700000000000 + sn,
+                'verify_token': 'bench',
+                'extra': {'type': 1, 'guild_id': '6543210987654321'},
+            },
+        }))
+    return payloads
+
+
+def decode_raw_before(key: str, raw: bytes) -> dict:
+    """the decode path before key caching, kept here for comparison"""
+    raw = json.loads(str(raw, encoding='utf-8'))
+    data = base64.b64decode(raw['encrypt'])
+    data = AES.new(key=key.encode().ljust(32, b'\x00'), mode=AES.MODE_CBC,
+                   iv=data[0:16]).decrypt(base64.b64decode(data[16:]))
+    return json.loads(Padding.unpad(data, 16).decode('utf-8'))
+
+
+def main():
+    payloads = corpus()
+    cert = Cert(token='', verify_token='bench', encrypt_key=ENCRYPT_KEY)
+
+    def before():
+        for raw in payloads:
+            decode_raw_before(ENCRYPT_KEY, raw)
+
+    def after():
+        for raw in payloads:
+            cert.decode_raw(raw)
+
+    def after_batch():
+        cert.decode_raw_batch(payloads)
+
+    for name, fn in (('before', before), ('after', after), ('batch', after_batch)):
+        best = min(timeit.repeat(fn, number=1, repeat=7))
+        print(f'{name:>8}: {len(payloads) / best:12.0f} payloads/sec')
+
+
+if __name__ == '__main__':
+    main()
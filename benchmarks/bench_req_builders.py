@@ -0,0 +1,78 @@
+"""cost of building a _Req by the hottest api functions, before and after precompiling the builders
+
+usage: python benchmarks/bench_req_builders.py
+"""
+import functools
+import inspect
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from akyrabot.khl import api  # noqa: E402
+from akyrabot.khl.api import _RE_ROUTE, _Req  # noqa: E402
+
+
+def req_before(method: str, **http_fields):
+    """the decorator before precompiling, kept here for comparison, form-data is left out"""
+
+    def _method(func):
+
+        @functools.wraps(func)
+        def req_maker(*args, **kwargs) -> _Req:
+            route = _RE_ROUTE.sub('-', func.__qualname__).lower().replace('.', '/')
+
+            param_names = list(inspect.signature(func).parameters.keys())
+            for i, arg in enumerate(args):
+                kwargs[param_names[i].lstrip('_')] = arg
+
+            params = {'json' if method == 'POST' else 'params': kwargs}
+            params.update(http_fields)
+            return _Req(method, route, params)
+
+        return req_maker
+
+    return _method
+
+
+class Message:
+    """same stubs as api.Message, built by the old decorator"""
+
+    @staticmethod
+    @req_before('POST')
+    def create(type, target_id, content, quote, nonce, temp_target_id):
+        ...
+
+
+class User:
+    """same stubs as api.User, built by the old decorator"""
+
+    @staticmethod
+    @req_before('GET')
+    def view(user_id, guild_id):
+        ...
+
+
+CASES = {
+    'Message.create': (
+        lambda: Message.create(type=1, target_id='1234567890123456', content='hello'),
+        lambda: api.Message.create(type=1, target_id='1234567890123456', content='hello'),
+    ),
+    'User.view': (
+        lambda: User.view('987654321', '6543210987654321'),
+        lambda: api.User.view('987654321', '6543210987654321'),
+    ),
+}
+
+
+def main(n: int = 100000):
+    for name, (before, after) in CASES.items():
+        assert before() == after(), name
+        for label, fn in (('before', before), ('after', after)):
+            best = min(timeit.repeat(fn, number=n, repeat=5))
+            print(f'{name:>15} {label:>6}: {n / best:12.0f} reqs/sec')
+
+
+if __name__ == '__main__':
+    main()